@@ -0,0 +1,107 @@
+import os
+import gc
+import json
+import queue
+import time
+import threading
+import resource
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from database import pool_stats
+from pipeline import DatabaseSink
+from scheduler import scheduler_from_env
+
+def memory_usage():
+    """Returns the current and peak resident memory in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KB on Linux
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        current = None
+    return {'rss_mb': current, 'peak_rss_mb': peak}
+
+class Daemon:
+    """Keeps one warm process with imports, sessions and the DB pool loaded and runs the scheduler in it"""
+
+    def __init__(self, scheduler, tick_seconds=1.0):
+        self.scheduler = scheduler
+        self.tick_seconds = tick_seconds
+        self.started_at = time.time()
+        self._triggers = queue.Queue()
+        self._lock = threading.Lock()
+        self._status = scheduler.status()
+
+    def run(self):
+        """Runs scheduling ticks and frees the previous board's garbage after every analysis"""
+        while True:
+            # Triggers are applied on the scheduling thread so the scheduler is never touched concurrently
+            while not self._triggers.empty():
+                self.scheduler.trigger(self._triggers.get())
+
+            analyses = self.scheduler.analyses
+            self.scheduler.tick()
+            if self.scheduler.analyses != analyses:
+                gc.collect() # keep memory flat across days of cycles
+
+            with self._lock:
+                self._status = self.scheduler.status()
+            time.sleep(self.tick_seconds)
+
+    def trigger(self, books=None):
+        """Starts a cycle for the given books (or every book) on the next tick"""
+        self._triggers.put(books)
+
+    def status(self):
+        """Returns the scheduler state as of the last tick along with the pool and memory status"""
+        with self._lock:
+            status = dict(self._status)
+        status['uptime'] = time.time() - self.started_at
+        status['pool'] = pool_stats()
+        status['memory'] = memory_usage()
+        return status
+
+def make_handler(daemon):
+    """Builds the control interface handler: GET /status and POST /cycle[?books=a,b]"""
+
+    class ControlHandler(BaseHTTPRequestHandler):
+        def send_json(self, code, data):
+            body = json.dumps(data, default=str).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/status':
+                self.send_json(200, daemon.status())
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            path, _, query = self.path.partition('?')
+            if path == '/cycle':
+                books = query.partition('books=')[2]
+                daemon.trigger(books.split(',') if books else None)
+                self.send_json(202, {'triggered': books.split(',') if books else 'all'})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass # keep the control requests out of the scraper logs
+
+    return ControlHandler
+
+def main():
+    daemon = Daemon(scheduler_from_env(sink=DatabaseSink()))
+
+    # The control interface only listens locally
+    port = int(os.getenv("DAEMON_PORT", 8750))
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(daemon))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Daemon control interface listening on 127.0.0.1:{port}")
+
+    daemon.run()
+
+if __name__ == '__main__':
+    main()
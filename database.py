@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+import mysql.connector
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load the .env file once for every module that uses the database
+load_dotenv()
+
+class ConnectionPool:
+    """Thread-safe pool of warm MySQL connections with pre-ping and a max connection lifetime"""
+
+    def __init__(self, size=5, pre_ping=True, max_lifetime=3600, timeout=30):
+        self.size = size
+        self.pre_ping = pre_ping
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self._idle = queue.LifoQueue() # reuse the most recently returned connection first
+        self._lock = threading.Lock()
+        self._open = 0
+        self._stats = {'checkouts': 0, 'connects': 0, 'reconnects': 0, 'wait_time': 0.0, 'max_wait': 0.0}
+
+    def _connect(self):
+        """Opens a new MySQL connection and records when it was created"""
+        conn = mysql.connector.connect(
+            host=os.getenv("DB_HOST"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            database=os.getenv("DB_NAME")
+        )
+        with self._lock:
+            self._stats['connects'] += 1
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        """Closes a connection without returning it to the pool"""
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def checkout(self):
+        """Returns a (connection, created_at) pair, waiting for one to be released if the pool is full"""
+        start = time.monotonic()
+        try:
+            conn, created_at = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._open < self.size
+                if can_open:
+                    self._open += 1
+            if can_open:
+                try:
+                    conn, created_at = self._connect()
+                except mysql.connector.Error:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                try:
+                    conn, created_at = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise mysql.connector.errors.PoolError(f"No connection available after {self.timeout}s") from None
+
+        # Replace connections that are too old or no longer alive
+        if time.monotonic() - created_at > self.max_lifetime:
+            self._discard(conn)
+            conn, created_at = self._reconnect()
+        elif self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._discard(conn)
+                conn, created_at = self._reconnect()
+
+        wait = time.monotonic() - start
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time'] += wait
+            self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+        return conn, created_at
+
+    def _reconnect(self):
+        """Opens a replacement for a discarded connection while keeping its pool slot"""
+        with self._lock:
+            self._stats['reconnects'] += 1
+        try:
+            return self._connect()
+        except mysql.connector.Error:
+            with self._lock:
+                self._open -= 1
+            raise
+
+    def release(self, conn, created_at):
+        """Returns a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            with self._lock:
+                self._open -= 1
+            return
+        self._idle.put((conn, created_at))
+
+    def close(self):
+        """Closes every idle connection"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+            with self._lock:
+                self._open -= 1
+
+    def stats(self):
+        """Returns pool statistics such as checkouts and total/max wait time"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        stats['avg_wait'] = stats['wait_time'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+pool = ConnectionPool(
+    size=int(os.getenv("DB_POOL_SIZE", 5)),
+    pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+)
+
+@contextmanager
+def connect_to_sql():
+    """Checks out a pooled connection using contextmanager to efficiently manage the connection and cursor"""
+    conn, cursor, created_at = None, None, None
+    try:
+        conn, created_at = pool.checkout()
+        cursor = conn.cursor()
+        yield cursor, conn  # Yield both cursor and connection to use inside the `with` block
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+    finally: # close cursor and return conn to the pool after usage
+        if cursor:
+            cursor.close()
+        if conn:
+            pool.release(conn, created_at)
+
+def pool_stats():
+    """Returns the shared pool's statistics"""
+    return pool.stats()
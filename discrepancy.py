@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+# Only these books can be the top book since we can only find EV+ bets in dfs apps
+DFS_APPS = {'vividpicks', 'parlayplay', 'sleeper', 'prizepicks', 'underdog'}
+
+RESULT_COLUMNS = ['player', 'prop', 'stat_value', 'o/u', 'top_sb', 'top_multi', 'low_sb', 'low_multi', 'spread', 'avg_multi']
+
+def odds_columns(sportbook):
+    """Returns the over and under multiplier column names for a sportsbook"""
+    return f'{sportbook}_over', f'{sportbook}_under'
+
+def build_odds_array(df, sportsbooks):
+    """Builds a dense (props x books x 2) float array of over/under multipliers with NaN where a book has no line"""
+    columns = [column for sportbook in sportsbooks for column in odds_columns(sportbook)]
+    return df[columns].to_numpy(dtype=float).reshape(len(df), len(sportsbooks), 2)
+
+def round_multipliers(values):
+    """Rounds to 2 decimals the same way the builtin round() does so results match the stored values exactly"""
+    return np.array([round(value, 2) for value in values.tolist()], dtype=float)
+
+def last_index(values, axis=1):
+    """Returns the index of the last occurrence of the max along the books axis"""
+    return values.shape[axis] - 1 - np.argmax(np.flip(values, axis=axis), axis=axis)
+
+def trimmed_average(values, present):
+    """Averages each prop's multipliers after dropping the max and, if more than one is left, the min"""
+    n_props, n_books = values.shape
+    rows = np.arange(n_props)
+    count = present.sum(axis=1)
+
+    # Drop the first occurrence of the max
+    remaining = present.copy()
+    max_idx = np.argmax(np.where(present, values, -np.inf), axis=1)
+    remaining[rows, max_idx] = False
+
+    # Drop the first occurrence of the min from what is left when there are at least two values left
+    min_idx = np.argmin(np.where(remaining, values, np.inf), axis=1)
+    drop_min = count > 2
+    remaining[rows[drop_min], min_idx[drop_min]] = False
+
+    # Sum in book order so the floating point result is identical to summing a list
+    total = np.zeros(n_props)
+    for j in range(n_books):
+        total = total + np.where(remaining[:, j], values[:, j], 0.0)
+    kept = remaining.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(kept > 0, total / kept, np.nan)
+
+def find_discrepancies(odds, sportsbooks):
+    """Finds the best dfs book, worst book, spread and trimmed average for every prop and side in one pass"""
+    sportsbooks = np.asarray(sportsbooks, dtype=object)
+    is_dfs = np.array([sportbook in DFS_APPS for sportbook in sportsbooks], dtype=bool)
+
+    # A book only counts for a prop when it has both the over and under multiplier
+    present = ~np.isnan(odds).any(axis=2)
+    eligible = present & is_dfs
+
+    # Props without a dfs app can't be the best value so they are skipped entirely
+    valid = eligible.any(axis=1)
+    odds, present, eligible = odds[valid], present[valid], eligible[valid]
+
+    sides = {}
+    for side, label in enumerate(('O', 'U')):
+        values = odds[:, :, side]
+        best_values = np.where(eligible, values, -np.inf)
+        worst_values = np.where(present, values, np.inf)
+
+        # Ties go to the later sportsbook to match the original >= / <= comparisons
+        best_idx = last_index(best_values)
+        worst_idx = last_index(-worst_values)
+        best = best_values.max(axis=1)
+        worst = worst_values.min(axis=1)
+
+        sides[label] = {
+            'top_sb': sportsbooks[best_idx],
+            'top_multi': best,
+            'low_sb': sportsbooks[worst_idx],
+            'low_multi': worst,
+            'spread': round_multipliers(np.abs(worst - best)),
+            'avg_multi': round_multipliers(trimmed_average(values, present)),
+        }
+
+    return valid, sides
+
+def discrepancy_frame(df, sportsbooks):
+    """Builds the over and under result rows for every prop that has at least one dfs app"""
+    odds = build_odds_array(df, sportsbooks)
+    valid, sides = find_discrepancies(odds, sportsbooks)
+    keys = df.loc[valid, ['player', 'prop', 'stat_value']].reset_index(drop=True)
+
+    frames = []
+    for label, result in sides.items():
+        frame = keys.copy()
+        frame['o/u'] = label
+        for column, values in result.items():
+            frame[column] = values
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)[RESULT_COLUMNS]
@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+from urllib.parse import urlencode
+
+def cache_key(url, params=None, body=None):
+    """Identifies a request by its url, query parameters and body"""
+    key = f'{url}?{urlencode(sorted(params.items()))}' if params else url
+    return f'{key} {body}' if body else key
+
+def fetch_name(sportbook, leagues=None):
+    """Names a fetch of only some of a book's leagues so it's tracked apart from the book's full fetch"""
+    return f"{sportbook}:{','.join(leagues)}" if leagues else sportbook
+
+CACHE_RESPONSES_QUERY = '''
+CREATE TABLE IF NOT EXISTS responses (
+    request TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    hash TEXT NOT NULL,
+    rows TEXT NOT NULL
+) WITHOUT ROWID
+'''
+
+CACHE_FETCHES_QUERY = '''
+CREATE TABLE IF NOT EXISTS fetches (
+    book TEXT PRIMARY KEY,
+    requests TEXT NOT NULL
+)
+'''
+
+class ResponseCache:
+    """Remembers each request's validators, body hash and parsed rows so an unchanged payload is never parsed twice
+
+    Entries are kept in a SQLite file as well as in memory, so the scrapers that run_function.py
+    starts in a fresh process every cycle still send conditional requests and skip unchanged
+    boards. The parsed rows are stored with the validators because a 304 has no body to parse.
+    """
+
+    def __init__(self, path=None, enabled=True):
+        self.path = path  # None keeps the entries in memory only
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {'etag', 'last_modified', 'hash', 'rows'}, read from disk on first use
+        self._book_keys = {}  # book -> keys resolved on its last fetch
+        self._changed = {}  # book -> whether its last fetch returned new data
+
+    def connect(self):
+        # Several scraper processes share the file, so wait on a lock instead of failing
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute(CACHE_RESPONSES_QUERY)
+        conn.execute(CACHE_FETCHES_QUERY)
+        return conn
+
+    def entry(self, key):
+        """Returns the cached entry for a request (None if it was never seen)"""
+        with self._lock:
+            if key in self._entries or not self.enabled or self.path is None:
+                return self._entries.get(key)
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute('SELECT etag, last_modified, hash, rows FROM responses WHERE request = ?', (key,)).fetchone()
+        entry = row and {'etag': row[0], 'last_modified': row[1], 'hash': row[2], 'rows': json.loads(row[3])}
+        with self._lock:
+            return self._entries.setdefault(key, entry)
+
+    def store(self, key, headers, digest, rows):
+        """Keeps a new entry in memory, it's written to disk when its book fetch finishes"""
+        with self._lock:
+            self._entries[key] = {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'hash': digest,
+                'rows': rows,
+            }
+
+    def conditional_headers(self, key):
+        """Returns If-None-Match / If-Modified-Since headers for a request seen before"""
+        entry = self.entry(key)
+        if not self.enabled or entry is None:
+            return {}
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def resolve(self, key, status, headers, body, parse):
+        """Returns (rows, changed), re-using the last rows on a 304 or an identical body"""
+        entry = self.entry(key)
+
+        if self.enabled and entry is not None and status == 304:
+            return entry['rows'], False
+
+        # Servers that ignore validators still send the same bytes for an unchanged board
+        digest = hashlib.sha1(body).hexdigest()
+        if self.enabled and entry is not None and digest == entry['hash']:
+            return entry['rows'], False
+
+        rows = parse(body)
+        self.store(key, headers, digest, rows)
+        return rows, True
+
+    def resolve_stream(self, key, status, headers, chunks, parse):
+        """Like resolve but parses the body while it downloads, hashing the chunks as they go past"""
+        entry = self.entry(key)
+
+        if self.enabled and entry is not None and status == 304:
+            return entry['rows'], False
+
+        digest = hashlib.sha1()
+        def hashed():
+            for chunk in chunks:
+                digest.update(chunk)
+                yield chunk
+        stream = hashed()
+        rows = parse(stream)
+        for _ in stream: # the hash has to cover the whole body
+            pass
+
+        # The rows were parsed already but an unchanged body still skips the export and re-analysis
+        if self.enabled and entry is not None and digest.hexdigest() == entry['hash']:
+            return entry['rows'], False
+
+        self.store(key, headers, digest.hexdigest(), rows)
+        return rows, True
+
+    def forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def fetch(self, sportbook):
+        """Starts tracking one fetch of a book across all of its requests"""
+        return BookFetch(self, sportbook)
+
+    def changed(self, sportbook):
+        """Returns whether the book's last fetch returned new data (True if it was never fetched)"""
+        with self._lock:
+            return self._changed.get(sportbook, True)
+
+    def last_keys(self, sportbook):
+        """Returns the keys the book's last fetch resolved, from disk if this process hasn't fetched it yet"""
+        with self._lock:
+            if sportbook in self._book_keys or not self.enabled or self.path is None:
+                return self._book_keys.get(sportbook)
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute('SELECT requests FROM fetches WHERE book = ?', (sportbook,)).fetchone()
+        return frozenset(json.loads(row[0])) if row else None
+
+    def _finish(self, sportbook, keys, changed, stored):
+        # A request that failed or disappeared drops rows so the book changed
+        changed = changed or not self.enabled or keys != self.last_keys(sportbook)
+        with self._lock:
+            self._book_keys[sportbook] = keys
+            self._changed[sportbook] = changed
+            entries = [(key, self._entries[key]) for key in stored]
+        # Only a fetch that got this far is saved, so a failed parse is fetched and parsed again next time
+        if changed and self.enabled and self.path is not None:
+            with closing(self.connect()) as conn, conn:
+                conn.executemany('INSERT OR REPLACE INTO responses (request, etag, last_modified, hash, rows) VALUES (?, ?, ?, ?, ?)',
+                                 [(key, entry['etag'], entry['last_modified'], entry['hash'], json.dumps(entry['rows']))
+                                  for key, entry in entries])
+                conn.execute('INSERT OR REPLACE INTO fetches (book, requests) VALUES (?, ?)', (sportbook, json.dumps(sorted(keys))))
+        return changed
+
+class BookFetch:
+    """Resolves every request of one book fetch and decides whether the book changed"""
+
+    def __init__(self, cache, sportbook):
+        self.cache = cache
+        self.sportbook = sportbook
+        self.keys = set()
+        self.stored = set()  # keys whose response was parsed again, saved to disk by finish
+        self.changed = False
+        self._lock = threading.Lock()
+
+    def conditional_headers(self, key):
+        return self.cache.conditional_headers(key)
+
+    def resolve(self, key, status, headers, body, parse):
+        rows, changed = self.cache.resolve(key, status, headers, body, parse)
+        with self._lock:
+            self.keys.add(key)
+            if changed:
+                self.stored.add(key)
+            self.changed = self.changed or changed
+        return rows
+
+    def resolve_stream(self, key, status, headers, chunks, parse):
+        rows, changed = self.cache.resolve_stream(key, status, headers, chunks, parse)
+        with self._lock:
+            self.keys.add(key)
+            if changed:
+                self.stored.add(key)
+            self.changed = self.changed or changed
+        return rows
+
+    def discard(self):
+        """Forgets the responses this fetch parsed, so a book whose rows couldn't be used is parsed again next time"""
+        self.cache.forget(self.stored)
+        self.stored = set()
+
+    def finish(self):
+        """Records the outcome and returns True if the book has new data"""
+        return self.cache._finish(self.sportbook, frozenset(self.keys), self.changed, self.stored)
+
+def cache_path():
+    return os.getenv("HTTP_CACHE_PATH") or os.path.join(os.getenv("OUTPUT_DIR", '.'), 'http_cache.sqlite')
+
+# Shared by every scraper in the process and, through HTTP_CACHE_PATH, by every scraper process; HTTP_CACHE=false turns it off
+http_cache = ResponseCache(cache_path(), enabled=os.getenv("HTTP_CACHE", "true").lower() == "true")
@@ -0,0 +1,105 @@
+import json
+import codecs
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = ',:]}' + _WHITESPACE
+
+def byte_chunks(body, size=65536):
+    """Splits an already downloaded body so it's decoded a piece at a time"""
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+class JsonStream:
+    """Walks a JSON document arriving in byte chunks without building the whole object tree"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Reads the next chunk into the buffer, dropping what was already consumed; False once the input ends"""
+        if self.exhausted:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(b'', final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at the end)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Grow the buffer geometrically so a large value isn't re-decoded once per chunk
+                target = 2 * (len(self.buffer) - self.pos)
+                if not self.fill():
+                    raise
+                while len(self.buffer) < target and self.fill():
+                    pass
+                continue
+            # A number cut off inside a chunk ('1.' of '1.25', '1.2' of '1.2e3') decodes as a shorter
+            # number, so it only counts once a delimiter or the end of the input follows it
+            if not self.exhausted and (end == len(self.buffer) or self.buffer[end] not in _DELIMITERS):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Yields the elements of the array starting at the current position one at a time"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+    def members(self, streamed=()):
+        """Yields (key, value) for a top-level object, or (key, element) for every element of a streamed array"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            if key in streamed and self.peek() == '[':
+                for element in self.items():
+                    yield key, element
+            else:
+                yield key, self.value()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
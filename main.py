@@ -1,204 +1,179 @@
 import pandas as pd
+import numpy as np
 import requests
 import pytz
-import mysql.connector
 import os
-from dotenv import load_dotenv
 from datetime import datetime
-from contextlib import contextmanager
 from collections import defaultdict
+from discrepancy import discrepancy_frame, odds_columns, RESULT_COLUMNS
+from schema import create_results_table, unified_storage, ODDS_COLUMNS
+from database import connect_to_sql
+from props import prop_registry
+from player_index import player_index
 
-@contextmanager
-def connect_to_sql():
-    """Connects to the SQL using contextmanager to efficiently manage the connection and cursor"""
-    conn = None
-    try:
-        # Load the .env file
-        load_dotenv()
-
-        # Connect to the MySQL database
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
-        cursor = conn.cursor()
-        yield cursor, conn  # Yield both cursor and connection to use inside the `with` block
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-    finally: # close cursor and conn after usage
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close() 
+# Columns that uniquely identify a prop in the *_results tables
+PROP_KEY = ['player', 'prop', 'stat_value', 'o/u']
+
+# List of sportsbooks in tie-break order and the sportsbooks that are never alerted on
+SPORTSBOOKS = ['draftkings', 'vividpicks', 'parlayplay', 'sleeper', 'prizepicks', 'underdog']
+BOOKIES = {'draftkings'}
+
+# Minimum number of sportsbooks a prop needs before it is compared (the old dropna(thresh=6) over 3 key columns)
+MIN_BOOKS = 3
 
 def create_table(cursor, table_name):
     """Creates a new table in the MySQL database """
-    create_table_query = f'''
-    CREATE TABLE IF NOT EXISTS {table_name}_results (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        player VARCHAR(255),
-        prop VARCHAR(255),
-        stat_value FLOAT,
-        `o/u` VARCHAR(10),
-        top_sb VARCHAR(255),
-        top_multi FLOAT,
-        low_sb VARCHAR(255),
-        low_multi FLOAT,
-        spread FLOAT,
-        avg_multi FLOAT
+    create_results_table(cursor, f'{table_name}_results')
+
+def load_staging_table(df, cursor, table_name):
+    """Bulk loads the current result set into a per-connection staging table"""
+    columns = ', '.join(f'`{col}`' for col in RESULT_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(RESULT_COLUMNS))
+
+    # Temporary tables are private to the connection so concurrent runs can't see each other's rows
+    cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {table_name}_results_staging LIKE {table_name}_results")
+    cursor.execute(f"DELETE FROM {table_name}_results_staging")
+
+    # Replace NaN with None so they are stored as NULL
+    rows = df[RESULT_COLUMNS].astype(object).where(df[RESULT_COLUMNS].notna(), None)
+    cursor.executemany(
+        f"INSERT INTO {table_name}_results_staging ({columns}) VALUES ({placeholders})",
+        list(rows.itertuples(index=False, name=None))
     )
-    '''
-    cursor.execute(create_table_query)
 
 def manage_database(df, cursor, conn, table_name):
-    """Manage the database by removing, updating, and inserting props."""
-    # Retrieve existing props from the database
-    cursor.execute(f"SELECT player, prop, stat_value, `o/u` FROM {table_name}_results")
-    existing_props = cursor.fetchall()
-    existing_props_set = set(existing_props)
+    """Manage the database by removing, updating, and inserting props with set-based statements."""
+    # Only keep one row per prop like the database does
+    df = df.drop_duplicates(subset=PROP_KEY)
 
-    # Convert DataFrame to a set of tuples for comparison
-    current_props_set = set(df[['player', 'prop', 'stat_value', 'o/u']].itertuples(index=False, name=None))
+    # Find the props that aren't in the database yet so they can be returned for the alert
+    cursor.execute(f"SELECT player, prop, stat_value, `o/u` FROM {table_name}_results")
+    existing_props = pd.DataFrame(cursor.fetchall(), columns=PROP_KEY)
+    merged = df.merge(existing_props.drop_duplicates(), on=PROP_KEY, how='left', indicator=True)
+    new_props = df[(merged['_merge'] == 'left_only').to_numpy()]
 
-    # Find props to remove, update, and insert
-    props_to_remove = existing_props_set - current_props_set
-    props_to_insert = current_props_set - existing_props_set
-    props_to_update = current_props_set & existing_props_set
+    # Write the new result set into the staging table in one batch
+    load_staging_table(df, cursor, table_name)
+    join_on = ' AND '.join(f'r.`{col}` = s.`{col}`' for col in PROP_KEY)
 
     # Remove props that aren't available anymore
-    for prop in props_to_remove:
-        cursor.execute(f"DELETE FROM {table_name}_results WHERE player=%s AND prop=%s AND stat_value=%s AND `o/u`=%s", prop)
+    cursor.execute(f"""
+        DELETE r FROM {table_name}_results r
+        LEFT JOIN {table_name}_results_staging s ON {join_on}
+        WHERE s.player IS NULL
+    """)
 
     # Update player props that had value changes
-    for prop in props_to_update:
-        row = df[(df['player'] == prop[0]) & (df['prop'] == prop[1]) & (df['stat_value'] == prop[2]) & (df['o/u'] == prop[3])].iloc[0]
-        cursor.execute(f"""
-            UPDATE {table_name}_results
-            SET top_sb=%s, top_multi=%s, low_sb=%s, low_multi=%s, spread=%s, avg_multi=%s
-            WHERE player=%s AND prop=%s AND stat_value=%s AND `o/u`=%s
-        """, (row['top_sb'], row['top_multi'], row['low_sb'], row['low_multi'], row['spread'], row['avg_multi'], row['player'], row['prop'], row['stat_value'], row['o/u']))
+    cursor.execute(f"""
+        UPDATE {table_name}_results r
+        JOIN {table_name}_results_staging s ON {join_on}
+        SET r.top_sb=s.top_sb, r.top_multi=s.top_multi, r.low_sb=s.low_sb, r.low_multi=s.low_multi,
+            r.spread=s.spread, r.avg_multi=s.avg_multi
+    """)
 
     # Insert new props that weren't in the pre-existing database
-    new_props = []
-    for prop in props_to_insert:
-        row = df[(df['player'] == prop[0]) & (df['prop'] == prop[1]) & (df['stat_value'] == prop[2]) & (df['o/u'] == prop[3])].iloc[0]
-        cursor.execute(f"""
-            INSERT INTO {table_name}_results (player, prop, stat_value, `o/u`, top_sb, top_multi, low_sb, low_multi, spread, avg_multi)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (row['player'], row['prop'], row['stat_value'], row['o/u'], row['top_sb'], row['top_multi'], row['low_sb'], row['low_multi'], row['spread'], row['avg_multi']))
-        new_props.append(row)
+    columns = ', '.join(f'`{col}`' for col in RESULT_COLUMNS)
+    staged_columns = ', '.join(f's.`{col}`' for col in RESULT_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO {table_name}_results ({columns})
+        SELECT {staged_columns} FROM {table_name}_results_staging s
+        LEFT JOIN {table_name}_results r ON {join_on}
+        WHERE r.player IS NULL
+    """)
 
     # Commit the changes
     conn.commit()
 
-    return pd.DataFrame(new_props)
+    return new_props.reset_index(drop=True)
 
-def load_data_from_db(table_name):
+def load_data_from_db(cursor, table_name):
     """Load data from MySQL database."""
-    with connect_to_sql() as (cursor, conn):
-        # Fetch column names excluding 'id'
-        cursor.execute(f"SHOW COLUMNS FROM {table_name}")
-        columns = [col[0] for col in cursor.fetchall() if col[0] != 'id']
-        
-        # Select only the columns excluding 'id'
-        query = f"SELECT {', '.join(columns)} FROM {table_name}"
-        cursor.execute(query)
-        data = cursor.fetchall()
-        
-        return pd.DataFrame(data, columns=columns)
-
-def merge_dataframes(merged_df, sportsbook):
-    """Merge two DataFrames on 'player', 'prop', and 'stat_value'."""
-    return pd.merge(merged_df, sportsbook, on=["player", "prop", "stat_value"], how='outer')
-
-def find_greatest_difference(row, sportsbooks):
-    """Finds the greatest difference in multiplers between sportsbooks in a row"""
-    differences = {}
-    dfs_apps = {'vividpicks', 'parlayplay', 'sleeper', 'prizepicks', 'underdog'}
-    
-    # Add eligible props to the differences map
+    # Fetch column names excluding 'id'
+    cursor.execute(f"SHOW COLUMNS FROM {table_name}")
+    columns = [col[0] for col in cursor.fetchall() if col[0] != 'id']
+
+    # Select only the columns excluding 'id'
+    query = f"SELECT {', '.join(columns)} FROM {table_name}"
+    cursor.execute(query)
+    data = cursor.fetchall()
+
+    return pd.DataFrame(data, columns=columns)
+
+def load_odds_from_db(cursor, batch_size=10000):
+    """Load the whole current board from the unified odds table in one streamed query."""
+    cursor.execute(f"SELECT {', '.join(ODDS_COLUMNS)} FROM odds")
+
+    # Stream the rows in batches instead of materializing one huge list of tuples
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        chunks.append(pd.DataFrame(rows, columns=ODDS_COLUMNS))
+
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=ODDS_COLUMNS)
+
+def load_board(cursor, sportsbooks):
+    """Load every sportsbook's rows as one long DataFrame with a 'book' column."""
+    if unified_storage():
+        long_df = load_odds_from_db(cursor)
+    else:
+        # Load data for each sportbook table and stack them
+        dataframes = []
+        for sportbook in sportsbooks:
+            table_name = (f'{sportbook}_data')
+            dataframes.append(load_data_from_db(cursor, table_name).assign(book=sportbook))
+        long_df = pd.concat(dataframes, ignore_index=True)
+
+    return long_df, order_sportsbooks(sportsbooks, long_df)
+
+def order_sportsbooks(sportsbooks, long_df):
+    """Remove sportsbooks without data and pick up any new books found in the data."""
+    found = set(long_df['book'])
+    return [sportbook for sportbook in sportsbooks if sportbook in found] + sorted(found - set(sportsbooks))
+
+def resolve_player_ids(long_df):
+    """Maps every row's (book, player) to its integer player id, resolving each distinct pair once."""
+    codes, pairs = pd.MultiIndex.from_frame(long_df[['book', 'player']]).factorize()
+    return np.asarray(player_index().resolve_all(pairs), dtype=np.int64)[codes]
+
+def join_sportsbooks(long_df, sportsbooks):
+    """Pivot the stacked sportsbook rows into a wide table keyed on 'player', 'prop', and 'stat_value'."""
+    # Join on integer player ids so accents and suffixes don't split a player across books
+    long_df = long_df.dropna(subset=['player'])
+    long_df = long_df.assign(player_id=resolve_player_ids(long_df))
+    keys = ['player_id', 'prop', 'stat_value']
+    long_df = long_df.drop_duplicates(subset=keys + ['book'])
+
+    # Pivot into one over and one under column block per sportsbook
+    wide = long_df.set_index(keys + ['book'])[['over_multi', 'under_multi']].unstack('book')
+    over, under = wide['over_multi'], wide['under_multi']
+
+    # Remove props unless they are on at least MIN_BOOKS sportsbooks
+    book_count = (over.notna() | under.notna()).sum(axis=1)
+    keep = (book_count >= MIN_BOOKS).to_numpy()
+    over, under = over[keep], under[keep]
+
+    # Keep the over and under multipliers as native float columns per sportsbook
+    columns = {}
     for sportbook in sportsbooks:
-        multipliers = row[sportbook]
-        if isinstance(multipliers, (list, tuple)) and len(multipliers) == 2:
-            differences[sportbook] = (multipliers[0], multipliers[1])
-    
-    # Initialize variables to track the minimum and maximum values along with their associated sportsbook
-    worstOver, bestOver = float("inf"), float("-inf")
-    worstUnder, bestUnder = float("inf"), float("-inf")
-    worstOverSportbook, bestOverSportbook = None, None
-
-    # Find the sportsbook with the maximum difference and append to list to find avg
-    overList, underList = [], []
-    for sportbook, (overMultiplier, underMultiplier) in differences.items():
-        # Append to over/under list
-        overList.append(overMultiplier), underList.append(underMultiplier)
-
-        # Potentially update best value lines
-        if sportbook in dfs_apps: # only find EV+ bets in dfs apps
-            if overMultiplier >= bestOver:
-                bestOver = overMultiplier
-                bestOverSportbook = sportbook
-            if underMultiplier >= bestUnder:
-                bestUnder = underMultiplier
-                bestUnderSportbook = sportbook
-
-        # Potentially update worst value lines
-        if overMultiplier <= worstOver:
-            worstOver = overMultiplier
-            worstOverSportbook = sportbook
-        if underMultiplier <= worstUnder:
-            worstUnder = underMultiplier
-            worstUnderSportbook = sportbook
-    
-    # Return None if the best value isn't connected to a dfs app
-    if not bestOverSportbook:
-        return None
-
-    # Find the over, under differences
-    overDiff, underDiff = round(abs(worstOver - bestOver), 2), round(abs(worstUnder - bestUnder), 2)
+        over_col, under_col = odds_columns(sportbook)
+        columns[over_col] = over[sportbook].to_numpy(dtype=float)
+        columns[under_col] = under[sportbook].to_numpy(dtype=float)
+    merged_df = pd.concat([over.index.to_frame(index=False), pd.DataFrame(columns)], axis=1)
+    index = player_index()
+    merged_df.insert(0, 'player', [index.name(player_id) for player_id in merged_df.pop('player_id').tolist()])
 
-    # Find the average of the list exclusing the outliers
-    overList.remove(max(overList))
-    underList.remove(max(underList))
-    if len(overList) > 1:
-        overList.remove(min(overList))
-    if len(underList) > 1:        
-        underList.remove(min(underList))
-    overAvg = round(sum(overList) / len(overList), 2)
-    underAvg = round(sum(underList) / len(underList), 2)
+    # Player and prop names repeat a lot so categoricals save most of the memory
+    merged_df['player'] = merged_df['player'].astype('category')
+    merged_df['prop'] = merged_df['prop'].astype('category')
 
-    overResult = ["O", bestOverSportbook, bestOver, worstOverSportbook, worstOver, overDiff, overAvg]
-    underResult = ["U", bestUnderSportbook, bestUnder, worstUnderSportbook, worstUnder, underDiff, underAvg]
-
-    return [overResult, underResult]
+    return merged_df
 
 def apply_find_greatest_difference(df, sportsbooks):
-    """Apply the find_greatest_difference() function onto the dataframe"""
-    # Apply the greatest difference function and separate the lists
-    results = df.apply(find_greatest_difference, sportsbooks=sportsbooks, axis=1)
-
-    # Filter out None results
-    valid_results = results[results.notnull()]
-    
-    # Split the valid_results into 'over' and 'under' DataFrames
-    over_results = valid_results.apply(lambda x: x[0])
-    under_results = valid_results.apply(lambda x: x[1])
-
-    # Create DataFrame columns from the results
-    temp1 = df.loc[valid_results.index].copy()
-    temp2 = df.loc[valid_results.index].copy()
-    temp1[['o/u', 'top_sb', 'top_multi', 'low_sb', 'low_multi', 'spread', 'avg_multi']] = pd.DataFrame(over_results.tolist(), index=temp1.index)
-    temp2[['o/u', 'top_sb', 'top_multi', 'low_sb', 'low_multi', 'spread', 'avg_multi']] = pd.DataFrame(under_results.tolist(), index=temp2.index)
-    combined_df = pd.merge(temp1, temp2, how='outer', on=['player', 'prop', 'stat_value', 'o/u', 'top_sb', 
-                                                          'top_multi', 'low_sb', 'low_multi', 'spread', 'avg_multi'])
-    
-    # Remove the sportsbooks cols containing the multipliers as they are not needed at this point
-    combined_df = combined_df[['player', 'prop', 'stat_value', 'o/u', 'top_sb', 'top_multi', 'low_sb', 
-                            'low_multi', 'spread', 'avg_multi']]
-    
-    return combined_df
+    """Apply the vectorized discrepancy engine onto the dataframe"""
+    # Finds the top dfs book, worst book, spread and trimmed average for every prop in one pass
+    return discrepancy_frame(df, sportsbooks)
 
 def apply_filters(df):
     # Remove low differences
@@ -212,11 +187,10 @@ def apply_filters(df):
 def save_all_props_to_csv(temp, sportsbooks):
     """Saves all the props to a csv to make it easier to read and anaylze"""
     # Convert back to american odds for readability
-    if 'bet365' in sportsbooks:
-        temp['bet365'] = temp.apply(lambda row: decimal_to_american('bet365', row), axis=1)
-
-    if 'draftkings' in sportsbooks:
-        temp['draftkings'] = temp.apply(lambda row: decimal_to_american('draftkings', row), axis=1)
+    for sportbook in ('bet365', 'draftkings'):
+        if sportbook in sportsbooks:
+            for column in odds_columns(sportbook):
+                temp[column] = decimal_to_american(sportbook, temp[column])
 
     # Export to csv
     output_dir = os.getenv("OUTPUT_DIR")
@@ -226,75 +200,53 @@ def save_to_csv(df, filepath):
     """Save the DataFrame to a CSV file."""
     df.to_csv(filepath, index=False)
 
-def identify_unique_props(dataframes, sportsbooks):
-    """Identify unique prop names that are only present in one sportsbook."""
-    prop_sets = {sportbook: set(df['prop']) for sportbook, df in dataframes.items()}
-    all_props = set.union(*prop_sets.values())
-    unique_props = {prop: [sportbook for sportbook in sportsbooks if prop in prop_sets[sportbook]] for prop in all_props}
-    unique_props = {prop: sportbook_list for prop, sportbook_list in unique_props.items() if len(sportbook_list) == 1}
-    
-    # Display unique props and their corresponding sportsbook
-    for prop, sportbook_list in unique_props.items():
-        if sportbook_list[0] != "underdog":
-            print(f"Prop: {prop} is only present in: {sportbook_list[0]}")
-
-def decimal_to_american(sportbook, row):
-    """Convert decimal odds to American odds."""
-    decimal_odds = row[sportbook]
-
-    # Skip if nan
-    if not decimal_odds or isinstance(decimal_odds, float):
-        return None
+def report_unmapped_props(sportsbooks):
+    """Reports the markets each sportsbook sent since the last cycle that the prop registry couldn't resolve"""
+    return {sportbook: prop_registry.report_unmapped(sportbook) for sportbook in sportsbooks}
 
+def decimal_to_american(sportbook, decimal_odds):
+    """Convert a column of decimal odds to American odds."""
     # Reverse diluted odds
     if sportbook == "bet365":
-        decimal_odds = [(((decimal_odds[0] - 1) / 0.8855) + 1), (((decimal_odds[1] - 1) / 0.8855) + 1)]
+        decimal_odds = ((decimal_odds - 1) / 0.8855) + 1
     elif sportbook == "draftkings":
-        decimal_odds = [(((decimal_odds[0] - 1) / 0.924) + 1), (((decimal_odds[1] - 1) / 0.924) + 1)]
-
-    # Convert each element of the decimal_odds list to American odds
-    american_odds = []
-    for odds in decimal_odds:
-        if odds == 1: # prevent float division by zero
-            american_odds.append(0)
-            continue
-        if odds >= 2.0:
-            new_odds = (odds - 1) * 100
-            rounded_odds = round(new_odds / 5) * 5
-            american_odds.append(rounded_odds)
-        else:
-            new_odds = -100 / (odds - 1)
-            rounded_odds = round(new_odds / 5) * 5
-            american_odds.append(rounded_odds)
-        
-    return american_odds
-
-def retrieve_prop_info(all_props, new_props, sportsbooks):
-    '''Finds all the matching rows between two dataframes'''
-    # Initialize an empty DataFrame to collect matching rows
-    matching_rows = pd.DataFrame()
-
-    # Iterate through each row in new_props
-    for _, row in new_props.iterrows():
-        matching_row = all_props[
-            (all_props['player'] == row['player']) &
-            (all_props['prop'] == row['prop']) &
-            (all_props['stat_value'] == row['stat_value'])
-        ]
-
-        # Get the over or under line depending
-        if not matching_row.empty:
-            for book in sportsbooks:
-                if book in matching_row.columns:
-                    if row['o/u'] == 'O':
-                        matching_row.loc[:, book] = matching_row[book].apply(lambda x: x[0] if isinstance(x, list) and len(x) > 0 else None)
-                    elif row['o/u'] == 'U':
-                        matching_row.loc[:, book] = matching_row[book].apply(lambda x: x[1] if isinstance(x, list) and len(x) > 1 else None)
-
-            # Append the modified row to the results DataFrame
-            matching_rows = pd.concat([matching_rows, matching_row])
-
-    return matching_rows
+        decimal_odds = ((decimal_odds - 1) / 0.924) + 1
+
+    # Convert to American odds rounded to the nearest 5
+    with np.errstate(divide='ignore'):
+        american_odds = np.where(decimal_odds >= 2.0, (decimal_odds - 1) * 100, -100 / (decimal_odds - 1))
+    american_odds = np.round(american_odds / 5) * 5
+    american_odds = np.where(decimal_odds == 1, 0, american_odds) # prevent float division by zero
+
+    # Nullable integers keep missing odds as NA
+    return pd.Series(american_odds, index=decimal_odds.index).astype('Int64')
+
+def index_props(all_props, sportsbooks):
+    """Indexes all props on (player, prop, stat_value) once so new props can be looked up with a join"""
+    columns = [column for sportbook in sportsbooks for column in odds_columns(sportbook)]
+    return all_props.set_index(PROP_KEY[:3])[columns]
+
+def retrieve_prop_info(indexed_props, new_props, sportsbooks):
+    '''Maps each new prop to the odds every sportsbook has on the same side of the line'''
+    # Join the new props onto the indexed props in one pass
+    matching_rows = new_props[PROP_KEY].join(indexed_props, on=PROP_KEY[:3], how='inner')
+    is_over = (matching_rows['o/u'] == 'O').to_numpy()
+
+    # Get the over or under line depending on the side of the new prop
+    side_odds = {}
+    for book in sportsbooks:
+        over_col, under_col = odds_columns(book)
+        side_odds[book] = matching_rows[over_col].where(is_over, matching_rows[under_col]).tolist()
+
+    # Create a dictionary to store odds from all sportsbooks
+    sportsbook_odds = defaultdict(list)  # [prop, (sportbook, odds)]
+    prop_keys = zip(matching_rows['player'], matching_rows['prop'], matching_rows['stat_value'])
+    for row, prop_key in enumerate(prop_keys):
+        for book in sportsbooks:
+            if not pd.isnull(side_odds[book][row]):
+                sportsbook_odds[prop_key].append((book, side_odds[book][row]))
+
+    return sportsbook_odds
 
 def send_discord_webhook(df, sportsbook_odds):
     """Sends a discord webhook alert to a specific url"""
@@ -351,36 +303,10 @@ def send_discord_webhook(df, sportsbook_odds):
     
     requests.post(url, json=data)
 
-def main():
-    # List of sportsbooks
-    sportsbooks = ['draftkings', 'vividpicks', 'parlayplay', 'sleeper', 'prizepicks', 'underdog']
-    bookies = {'draftkings'}
-
-    # Dictionary to store DataFrames
-    dataframes = {}
-
-    # Load data for each sportbook and clean it
-    for sportbook in sportsbooks.copy():
-        # Remove suffixes from the sportbook name
-        sportbook_cleaned = sportbook.replace(' Jr', '').replace(' II', '').strip()
-        table_name = (f'{sportbook_cleaned}_data')
-        sportbook_df = load_data_from_db(table_name)
-
-        if sportbook_df.empty: # Remove if empty dataframe
-            sportsbooks.remove(sportbook)
-        else:
-            # Merge over and under multipliers into payout_multipliers list
-            sportbook_df[sportbook] = sportbook_df[['over_multi', 'under_multi']].values.tolist()
-            sportbook_df.drop(columns=['over_multi', 'under_multi'], inplace=True)
-            dataframes[sportbook] = sportbook_df
-
-    # Merge the dataframes
-    merged_df = dataframes[sportsbooks[0]]
-    for sportbook in sportsbooks[1:]:
-        merged_df = merge_dataframes(merged_df, dataframes[sportbook])
-
-    # Remove props that is only available unless its on at least 2 sportsbooks
-    merged_df.dropna(thresh=6, inplace=True)
+def analyze(long_df, sportsbooks):
+    """Find discrepancies on the stacked board and send alerts for the new ones."""
+    # Join the sportsbooks in one pass and keep the props that are on enough sportsbooks
+    merged_df = join_sportsbooks(long_df, sportsbooks)
 
     # Create a temp copy and then store all props to use for later usage
     all_props = merged_df.copy()
@@ -394,9 +320,12 @@ def main():
     dfs_df = {}
     grouped = filtered_df.groupby('top_sb') # groups the filtered_df by top_sb
     for sportbook, group in grouped:
-        if sportbook not in bookies:
+        if sportbook not in BOOKIES:
             dfs_df[sportbook] = group
     
+    # Index all props once for the alert lookups
+    indexed_props = index_props(all_props, sportsbooks)
+
     # Use the Context Manager for database operations
     with connect_to_sql() as (cursor, conn):
         for sportbook, df in dfs_df.items():
@@ -407,15 +336,7 @@ def main():
             # Only send discord alert if there are new props
             if not new_props.empty:
                 # Retrieve all odds given a list of props
-                matching_props = retrieve_prop_info(all_props, new_props, sportsbooks)
-                            
-                # Create a dictionary to store odds from all sportsbooks
-                sportsbook_odds = defaultdict(list)  # [prop, (sportbook, odds)]
-                for prop in matching_props.itertuples(index=False):
-                    prop_key = (prop.player, prop.prop, prop.stat_value) 
-                    for book in sportsbooks:
-                        if not pd.isnull(getattr(prop, book)):
-                            sportsbook_odds[prop_key].append((book, getattr(prop, book)))
+                sportsbook_odds = retrieve_prop_info(indexed_props, new_props, sportsbooks)
 
                 # Sort the new props by avg_multi
                 sorted_new_props = new_props.sort_values(by='avg_multi')
@@ -425,5 +346,12 @@ def main():
                 output_dir = os.getenv("OUTPUT_DIR")
                 save_to_csv(filtered_df, os.path.join(output_dir, 'sorted_filtered_discrepancies.csv'))
 
+def main():
+    # Load data for every sportbook over a single pooled connection
+    with connect_to_sql() as (cursor, conn):
+        long_df, sportsbooks = load_board(cursor, SPORTSBOOKS.copy())
+
+    analyze(long_df, sportsbooks)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from database import connect_to_sql
+from schema import publish_odds, ODDS_COLUMNS
+from httpcache import http_cache, fetch_name
+from main import analyze, order_sportsbooks, report_unmapped_props, SPORTSBOOKS
+
+# Make the scrapers importable (curl/ goes first so `import curl` finds curl.py)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BASE_DIR, 'web-scrapers', 'curl'))
+sys.path.append(os.path.join(BASE_DIR, 'web-scrapers'))
+sys.path.append(os.path.join(BASE_DIR, 'web-scrapers', 'scrapers'))
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'scrapers.settings')
+
+import draftkings
+import bet365
+import curl
+from scrapers.spiders import dfs
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.defer import deferred_from_coro
+
+# Scrapers that return their rows when called with export=False
+FETCHERS = {
+    'draftkings': lambda: draftkings.draftkings_scraper(export=False),
+    'bet365': lambda: bet365.bet365_scraper(export=False),
+    'prizepicks': lambda: curl.scrape_prizepicks(export=False),
+    'parlayplay': lambda: curl.scrape_parlayplay(export=False),
+}
+
+# Scrapers that can fetch some of their leagues, so the scheduler can poll each league on its own
+LEAGUE_FETCHERS = {
+    'draftkings': (draftkings.configured_leagues, lambda leagues: draftkings.draftkings_scraper(leagues, export=False)),
+    'prizepicks': (curl.prizepicks_leagues, lambda leagues: curl.scrape_prizepicks(leagues, export=False)),
+}
+
+# Spiders that keep their rows on spider.output_data when crawled with export=False
+SPIDERS = {
+    'underdog': dfs.UnderdogScraper,
+    'vividpicks': dfs.VividPicksScraper,
+    'sleeper': dfs.SleeperScraper,
+}
+
+_reactor_lock = threading.Lock()
+_runner = None
+
+def start_reactor():
+    """Runs the Twisted reactor in a background thread so spiders can be crawled more than once per process"""
+    global _runner
+    with _reactor_lock:
+        if _runner is None:
+            settings = get_project_settings()
+            install_reactor(settings['TWISTED_REACTOR'])
+            configure_logging(settings)
+            from twisted.internet import reactor
+            threading.Thread(target=reactor.run, kwargs={'installSignalHandlers': False}, daemon=True).start()
+            _runner = CrawlerRunner(settings)
+    return _runner
+
+def stop_crawler(crawler):
+    """Starts a graceful stop of a crawl that is still running"""
+    if not crawler.crawling:
+        return None
+    if hasattr(crawler, 'stop_async'): # Scrapy 2.14+
+        return deferred_from_coro(crawler.stop_async())
+    return crawler.stop()
+
+def crawl_spiders(spider_classes, deadline=None):
+    """Crawls the spiders concurrently on the reactor thread and returns their rows by sportsbook
+
+    With a deadline the crawls still running are stopped then and every download attempt times
+    out after it, so a hung spider returns without rows once its in-flight retries give up
+    instead of holding its thread.
+    """
+    runner = start_reactor()
+    from twisted.internet import reactor, defer, threads
+
+    def crawl_all():
+        kwargs = {'export': False}
+        if deadline:
+            kwargs['download_timeout'] = deadline # read by DownloadTimeoutMiddleware off the spider
+        crawlers = [runner.create_crawler(spider_class) for spider_class in spider_classes]
+        deferred = defer.DeferredList([crawler.crawl(**kwargs) for crawler in crawlers])
+        if deadline:
+            stop = reactor.callLater(deadline, lambda: [stop_crawler(crawler) for crawler in crawlers])
+
+            def cancel_stop(result):
+                if stop.active():
+                    stop.cancel()
+                return result
+            deferred.addBoth(cancel_stop)
+
+        # Spiders whose request failed or that were stopped never parsed anything so they are left out
+        deferred.addCallback(lambda _: {crawler.spidercls.name: crawler.spider.output_data
+                                        for crawler in crawlers if hasattr(crawler.spider, 'output_data')})
+        return deferred
+
+    return threads.blockingCallFromThread(reactor, crawl_all)
+
+def to_batch(sportbook, output_data):
+    """Converts a scraper's rows into a typed columnar batch in the analyzer's long format"""
+    batch = pd.DataFrame(output_data, columns=ODDS_COLUMNS[1:])
+    batch.insert(0, 'book', sportbook)
+    for column in ('stat_value', 'over_multi', 'under_multi'):
+        batch[column] = pd.to_numeric(batch[column], errors='coerce').astype(float)
+
+    # Rows without a line can't be joined across books
+    return batch.dropna(subset=['stat_value'])
+
+def export_json(sportbook, output_data):
+    """Writes a sportsbook's rows to its json output file"""
+    output_dir = os.getenv("OUTPUT_DIR")
+    with open(os.path.join(output_dir, f'{sportbook}_output.json'), 'w') as f:
+        json.dump(output_data, f, indent=2)
+
+class DatabaseSink:
+    """Persists scraped rows on a background thread so the analysis never waits on MySQL"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, sportbook, output_data):
+        """Queues a sportsbook's rows to be written"""
+        self._queue.put((sportbook, output_data))
+
+    def _run(self):
+        while True:
+            sportbook, output_data = self._queue.get()
+            try:
+                export_json(sportbook, output_data)
+                with connect_to_sql() as (cursor, conn):
+                    publish_odds(cursor, conn, sportbook, output_data)
+            except Exception as e:
+                print(f"Error persisting {sportbook} data: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued write is done"""
+        self._queue.join()
+
+def pipeline_books():
+    """Returns the sportsbooks to scrape, configurable with PIPELINE_BOOKS"""
+    books = os.getenv("PIPELINE_BOOKS")
+    return [book.strip() for book in books.split(',')] if books else SPORTSBOOKS.copy()
+
+def fetch_units(books):
+    """Splits the books into the units the scheduler polls: one per league for LEAGUE_FETCHERS, otherwise the book"""
+    units = []
+    for book in books:
+        if book in LEAGUE_FETCHERS:
+            units.extend(fetch_name(book, [league]) for league in LEAGUE_FETCHERS[book][0]())
+        else:
+            units.append(book)
+    return units
+
+def unit_book(unit):
+    """Returns the sportsbook a fetch unit belongs to"""
+    return unit.split(':')[0]
+
+def fetch_unit(unit, deadline=None):
+    """Scrapes a single fetch unit and returns its rows by unit (empty if the spider never parsed)
+
+    The deadline stops a spider's crawl, the other fetchers are bounded by their request timeouts.
+    """
+    book, _, league = unit.partition(':')
+    if league:
+        return {unit: LEAGUE_FETCHERS[book][1]([league])}
+    if book in SPIDERS:
+        return crawl_spiders([SPIDERS[book]], deadline)
+    return {book: FETCHERS[book]()}
+
+def stack_batches(batches):
+    """Stacks typed batches into the analyzer's long format"""
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=ODDS_COLUMNS)
+
+def scrape_books(books, sink=None):
+    """Runs every scraper concurrently and returns their rows as one stacked batch"""
+    batches = []
+    with ThreadPoolExecutor(max_workers=len(books)) as executor:
+        futures = {executor.submit(FETCHERS[book]): book for book in books if book in FETCHERS}
+        spider_classes = [SPIDERS[book] for book in books if book in SPIDERS]
+        if spider_classes:
+            futures[executor.submit(crawl_spiders, spider_classes)] = None
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error scraping {futures[future] or 'spiders'}: {e}")
+                continue
+
+            # Spiders return rows for several books at once
+            results = result if futures[future] is None else {futures[future]: result}
+            for sportbook, output_data in results.items():
+                batches.append(to_batch(sportbook, output_data))
+                # An unchanged board is already in MySQL
+                if sink and http_cache.changed(sportbook):
+                    sink.submit(sportbook, output_data)
+
+    return stack_batches(batches)
+
+def run_pipeline(books=None, sink=None):
+    """Scrapes every book in this process and hands the rows straight to the analysis"""
+    books = books or pipeline_books()
+    long_df = scrape_books(books, sink)
+    report_unmapped_props(books)
+    if long_df.empty:
+        print("No data scraped.")
+        return
+    if not any(http_cache.changed(book) for book in books):
+        print("No book changed since the last cycle.")
+        return
+
+    analyze(long_df, order_sportsbooks(SPORTSBOOKS, long_df))
+
+if __name__ == '__main__':
+    sink = DatabaseSink()
+    run_pipeline(sink=sink)
+    sink.flush()
@@ -0,0 +1,65 @@
+import os
+import time
+from datetime import datetime
+
+def parse_start_time(value):
+    """Converts an ISO timestamp or epoch milliseconds into epoch seconds (None if missing or unreadable)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+def parse_tiers(value):
+    """Parses 'seconds_to_start=interval,...' into a list of (seconds_to_start, interval) sorted by start"""
+    tiers = []
+    for item in filter(None, (value or '').split(',')):
+        horizon, interval = item.split('=')
+        tiers.append((float(horizon), float(interval)))
+    return sorted(tiers)
+
+class PollingPlanner:
+    """Polls fetch units (a book, or one league of a league-aware book) with events about to start often and the others rarely
+
+    Keying by league keeps a game about to start in one league from pulling every other
+    league of the same book onto the short interval.
+    """
+
+    def __init__(self, tiers, far_interval):
+        self.tiers = tiers
+        self.far_interval = far_interval
+        self.next_start = {}  # unit -> epoch seconds of its soonest upcoming event
+
+    def observe(self, unit, output_data, now=None):
+        """Records the soonest upcoming start time found in a unit's rows"""
+        now = now or time.time()
+        starts = [parse_start_time(data.get('start_time')) for data in output_data]
+        upcoming = [start for start in starts if start is not None and start >= now]
+        if upcoming:
+            self.next_start[unit] = min(upcoming)
+        else:
+            self.next_start.pop(unit, None)
+
+    def interval(self, unit, default, now=None):
+        """Returns the poll interval for a unit based on how soon its next event starts"""
+        next_start = self.next_start.get(unit)
+        if next_start is None:
+            return default # the feed has no start times so keep the configured interval
+
+        seconds_to_start = next_start - (now or time.time())
+        for horizon, interval in self.tiers:
+            if seconds_to_start <= horizon:
+                return interval
+        return self.far_interval
+
+def planner_from_env():
+    """Builds a planner configured with PRIORITY_TIERS and FAR_INTERVAL, or None if PRIORITY_POLLING is off"""
+    if os.getenv("PRIORITY_POLLING", "true").lower() != "true":
+        return None
+    return PollingPlanner(
+        parse_tiers(os.getenv("PRIORITY_TIERS", "1800=60,7200=300,21600=900")),
+        float(os.getenv("FAR_INTERVAL", 1800)),
+    )
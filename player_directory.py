@@ -0,0 +1,115 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import closing
+import requests
+from player_index import normalize_name
+
+DIRECTORY_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS players (
+    sport TEXT NOT NULL,
+    player_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (sport, player_id)
+) WITHOUT ROWID
+'''
+
+DIRECTORY_META_QUERY = '''
+CREATE TABLE IF NOT EXISTS refreshes (
+    sport TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL,
+    etag TEXT
+)
+'''
+
+def player_name(sport, player_info):
+    """Returns a player's name from a Sleeper directory entry (MLB keeps it in the metadata)"""
+    if sport == 'mlb':
+        return player_info.get("metadata", {}).get("full_name", "UNKNOWN")
+    return player_info.get("full_name", "UNKNOWN")
+
+class PlayerDirectory:
+    """Sleeper's player id -> name directory for one sport, cached on disk and refreshed in the background"""
+
+    def __init__(self, sport, path, ttl, timeout=30):
+        self.sport = sport
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.players = None  # loaded from disk on first use
+        self.refreshed_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(DIRECTORY_TABLE_QUERY)
+        conn.execute(DIRECTORY_META_QUERY)
+        return conn
+
+    def load(self):
+        """Reads the cached directory from disk"""
+        with closing(self.connect()) as conn, conn:
+            self.players = dict(conn.execute('SELECT player_id, name FROM players WHERE sport = ?', (self.sport,)))
+            row = conn.execute('SELECT refreshed_at FROM refreshes WHERE sport = ?', (self.sport,)).fetchone()
+            self.refreshed_at = row[0] if row else 0
+
+    def refresh(self):
+        """Downloads the directory (unless it's unchanged) and writes only the players that changed
+
+        A failed download raises before anything is written, so the cached directory is kept.
+        """
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute('SELECT etag FROM refreshes WHERE sport = ?', (self.sport,)).fetchone()
+            headers = {'If-None-Match': row[0]} if row and row[0] and self.players else {}
+            response = requests.get(f"https://api.sleeper.app/v1/players/{self.sport}", headers=headers, timeout=self.timeout)
+
+            if response.status_code != 304:
+                response.raise_for_status()
+                players = {player_id: normalize_name(player_name(self.sport, player_info))
+                           for player_id, player_info in response.json().items()}
+                current = self.players or {}
+                changed = [(self.sport, player_id, name) for player_id, name in players.items() if current.get(player_id) != name]
+                removed = [(self.sport, player_id) for player_id in current.keys() - players.keys()]
+                conn.executemany('INSERT OR REPLACE INTO players (sport, player_id, name) VALUES (?, ?, ?)', changed)
+                conn.executemany('DELETE FROM players WHERE sport = ? AND player_id = ?', removed)
+                self.players = players
+
+            self.refreshed_at = time.time()
+            conn.execute('INSERT OR REPLACE INTO refreshes (sport, refreshed_at, etag) VALUES (?, ?, ?)',
+                         (self.sport, self.refreshed_at, response.headers.get('ETag')))
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error refreshing the Sleeper {self.sport} player directory: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def player_map(self):
+        """Returns the id -> name map, only blocking on a download when nothing is cached yet"""
+        with self._lock:
+            if self.players is None:
+                self.load()
+            if not self.players:
+                self.refresh() # cold start, there's nothing to serve yet
+            elif time.time() - self.refreshed_at > self.ttl and not self._refreshing:
+                # Serve the cached names while a thread fetches the new directory
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return self.players
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def player_directory(sport):
+    """Returns the shared directory for a sport, configured with PLAYER_DIRECTORY_PATH, PLAYER_DIRECTORY_TTL and PLAYER_DIRECTORY_TIMEOUT"""
+    with _directories_lock:
+        if sport not in _directories:
+            path = os.getenv("PLAYER_DIRECTORY_PATH") or os.path.join(os.getenv("OUTPUT_DIR", '.'), 'sleeper_players.sqlite')
+            _directories[sport] = PlayerDirectory(sport, path, float(os.getenv("PLAYER_DIRECTORY_TTL", 86400)),
+                                                  float(os.getenv("PLAYER_DIRECTORY_TIMEOUT", 30)))
+        return _directories[sport]
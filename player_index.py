@@ -0,0 +1,169 @@
+import os
+import re
+import logging
+import sqlite3
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+from contextlib import closing
+
+INDEX_PLAYERS_QUERY = '''
+CREATE TABLE IF NOT EXISTS players (
+    player_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+)
+'''
+
+INDEX_ALIASES_QUERY = '''
+CREATE TABLE IF NOT EXISTS aliases (
+    book TEXT NOT NULL,
+    alias TEXT NOT NULL,
+    player_id INTEGER NOT NULL REFERENCES players (player_id),
+    confirmed INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (book, alias)
+) WITHOUT ROWID
+'''
+
+# Generational suffixes the books add or leave off at will
+SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+_PUNCTUATION = re.compile(r"[.'’`]")
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=65536)
+def normalize_name(name):
+    return unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii') # convert special characters
+
+@lru_cache(maxsize=65536)
+def match_key(name):
+    """Reduces a name to the form the books are matched on: ascii, lowercase, no punctuation or suffixes"""
+    name = _PUNCTUATION.sub('', normalize_name(name).lower())
+    tokens = _SEPARATORS.sub(' ', name).split()
+    while len(tokens) > 1 and tokens[-1] in SUFFIXES:
+        tokens.pop()
+    return ' '.join(tokens)
+
+class PlayerIndex:
+    """Maps every book's player names (or ids) to stable integer player ids
+
+    A name is resolved by its alias, then by its match key (which already absorbs accents,
+    punctuation and 'Jr.' style suffixes) and finally by a fuzzy comparison against the
+    players that share its first or last name token. Every resolution is stored in a SQLite
+    alias table so ids stay the same across runs and a wrong match can be fixed by hand.
+
+    Fuzzy matches only merge names across books (a book naming two players alike means two
+    players) and are logged and stored unconfirmed: they're matched again on the next run
+    until their alias is set to confirmed = 1.
+    """
+
+    def __init__(self, path, threshold=0.9):
+        self.path = path
+        self.threshold = threshold
+        self.aliases = None  # (book, alias) -> player id, loaded from disk on first use
+        self.names = {}  # player id -> display name
+        self.keys = {}  # match key -> player id
+        self.blocks = {}  # first or last name token -> {match key: player id}
+        self.book_players = {}  # book -> player ids it already has an alias for
+        self.next_id = 1
+        self._lock = threading.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(INDEX_PLAYERS_QUERY)
+        conn.execute(INDEX_ALIASES_QUERY)
+        # Alias tables created before fuzzy matches were kept unconfirmed
+        if 'confirmed' not in {column[1] for column in conn.execute('PRAGMA table_info(aliases)')}:
+            conn.execute('ALTER TABLE aliases ADD COLUMN confirmed INTEGER NOT NULL DEFAULT 1')
+        return conn
+
+    def load(self):
+        """Reads the players and aliases from disk"""
+        with closing(self.connect()) as conn, conn:
+            self.names = dict(conn.execute('SELECT player_id, name FROM players'))
+            self.aliases = {(book, alias): player_id for book, alias, player_id
+                            in conn.execute('SELECT book, alias, player_id FROM aliases WHERE confirmed = 1')}
+        self.next_id = max(self.names, default=0) + 1
+        for player_id, name in self.names.items():
+            self.add_key(match_key(name), player_id)
+        for (book, alias), player_id in self.aliases.items():
+            self.add_key(match_key(alias), player_id)
+            self.book_players.setdefault(book, set()).add(player_id)
+
+    def add_key(self, key, player_id):
+        self.keys.setdefault(key, player_id)
+        tokens = key.split()
+        for token in {tokens[0], tokens[-1]} if tokens else ():
+            self.blocks.setdefault(token, {})[key] = player_id
+
+    def fuzzy_match(self, book, key):
+        """Returns the one other book's player whose key is close enough to this one (None if there's none or it's ambiguous)"""
+        tokens = key.split()
+        if not tokens:
+            return None
+        candidates = {**self.blocks.get(tokens[0], {}), **self.blocks.get(tokens[-1], {})}
+        taken = self.book_players.get(book, set())
+
+        scores = {}
+        for candidate, player_id in candidates.items():
+            # Only the candidates sharing a first or last name are compared, never the whole index
+            if player_id in taken or candidate.split()[-1][0] != tokens[-1][0]:
+                continue
+            score = SequenceMatcher(None, key, candidate).ratio()
+            if score >= self.threshold:
+                scores[player_id] = max(score, scores.get(player_id, 0))
+        return next(iter(scores)) if len(scores) == 1 else None
+
+    def resolve_all(self, names):
+        """Returns the player id for every (book, name) pair, saving the new players and aliases in one transaction"""
+        with self._lock:
+            if self.aliases is None:
+                self.load()
+
+            new_players, new_aliases, ids = [], [], []
+            for book, name in names:
+                player_id = self.aliases.get((book, name))
+                if player_id is None:
+                    key = match_key(name)
+                    player_id, confirmed = self.keys.get(key), 1
+                    if player_id is None:
+                        player_id, confirmed = self.fuzzy_match(book, key), 0
+                        if player_id is not None:
+                            logger.warning(f"Fuzzy matched {book} player {name!r} to {self.names[player_id]!r} (player {player_id})")
+                    if player_id is None:
+                        confirmed = 1
+                        player_id, self.next_id = self.next_id, self.next_id + 1
+                        self.names[player_id] = normalize_name(name)
+                        new_players.append((player_id, self.names[player_id]))
+                    if confirmed:
+                        self.add_key(key, player_id) # a fuzzy match doesn't vouch for its key
+                    self.aliases[(book, name)] = player_id
+                    self.book_players.setdefault(book, set()).add(player_id)
+                    new_aliases.append((book, name, player_id, confirmed))
+                ids.append(player_id)
+
+            if new_aliases:
+                with closing(self.connect()) as conn, conn:
+                    conn.executemany('INSERT INTO players (player_id, name) VALUES (?, ?)', new_players)
+                    conn.executemany('INSERT OR REPLACE INTO aliases (book, alias, player_id, confirmed) VALUES (?, ?, ?, ?)', new_aliases)
+            return ids
+
+    def resolve(self, book, name):
+        return self.resolve_all([(book, name)])[0]
+
+    def name(self, player_id):
+        """Returns the display name of a player id"""
+        return self.names[player_id]
+
+_index = None
+_index_lock = threading.Lock()
+
+def player_index():
+    """Returns the shared index, configured with PLAYER_INDEX_PATH and PLAYER_MATCH_THRESHOLD"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            path = os.getenv("PLAYER_INDEX_PATH") or os.path.join(os.getenv("OUTPUT_DIR", '.'), 'players.sqlite')
+            _index = PlayerIndex(path, float(os.getenv("PLAYER_MATCH_THRESHOLD", 0.9)))
+        return _index
@@ -0,0 +1,132 @@
+import sys
+import threading
+from collections import Counter
+
+# Prop names every book is resolved to, the cross-book join only matches identical names
+CANONICAL_PROPS = [
+    # Baseball
+    "Strikeouts", "Pitching Outs", "Hits Allowed", "Walks Allowed", "Earned Runs Allowed",
+    "1st Inn. Runs Allowed", "2nd Inn. Runs Allowed", "Hits", "Runs", "RBIs", "Hits + Runs + RBIs",
+    "Total Bases", "Singles", "Doubles", "Triples", "Home Runs", "Stolen Bases", "Batter Walks",
+    "Batter Strikeouts", "Team Total Runs",
+    # Basketball
+    "Points", "Rebounds", "Assists", "Steals", "Blocks", "Turnovers", "3-Pointers Made",
+    "Pts + Rebs + Asts", "Points + Rebounds", "Points + Assists", "Rebounds + Assists", "Blocks + Steals",
+    # Football
+    "Passing Yards", "Passing TDs", "Passing Attempts", "Completions", "Longest Completion", "Interceptions",
+    "Rushing Yards", "Rushing TDs", "Rushing Attempts", "Receiving Yards", "Receiving TDs", "Tackles", "FG Made",
+    # Soccer, hockey and esports
+    "Shots on Target", "Shots Attempted", "Kills on Map 1+2", "Kills on Maps 1-3",
+    # Every sport
+    "Fantasy Points",
+]
+
+# Each book's raw market identifier -> canonical prop. Raw names that already are canonical need no alias
+BOOK_ALIASES = {
+    'draftkings': {
+        'Walks (Batter)': "Batter Walks", 'Strikeouts (Batter)': "Batter Strikeouts", 'Outs': "Pitching Outs",
+        'Alternate Team Total Runs': "Team Total Runs", 'Strikeouts Thrown': "Strikeouts",
+        'Run Line - 1st Inning': "1st Inn. Runs Allowed", 'Run Line - 2nd Inning': "2nd Inn. Runs Allowed",
+        'Three Pointers Made': "3-Pointers Made", 'Points + Rebounds + Assists': "Pts + Rebs + Asts",
+    },
+    # bet365 markets are requested by their pd, so this table is also the list of markets it scrapes
+    'bet365': {
+        'E160293': "Strikeouts", 'E160302': "Total Bases", 'E163109': "Hits", 'E160303': "Runs",
+        'E160304': "Stolen Bases", 'E160298': "Singles", 'E160299': "Doubles", 'E160300': "Triples",
+        'E160297': "Pitching Outs", 'E163108': "Walks Allowed", 'E160296': "Earned Runs Allowed", 'E160295': "Hits Allowed",
+        'E163218': "Hits + Runs + RBIs", 'E163219': "Batter Strikeouts",
+    },
+    'prizepicks': {
+        'Hitter Fantasy Score': "Fantasy Points", 'Pitcher Fantasy Score': "Fantasy Points", 'Hits+Runs+RBIs': "Hits + Runs + RBIs",
+        'Pitcher Strikeouts': "Strikeouts", 'Hitter Strikeouts': "Batter Strikeouts", 'Pts+Rebs+Asts': "Pts + Rebs + Asts",
+        'Pts+Asts': "Points + Assists", 'Pts+Rebs': "Points + Rebounds", 'Rebs+Asts': "Rebounds + Assists",
+        'Blks+Stls': "Blocks + Steals", '3-PT Made': "3-Pointers Made",
+    },
+    'parlayplay': {
+        'Fantasy Score': "Fantasy Points", 'Batting Walks': "Batter Walks", 'Outs': "Pitching Outs",
+        'Batting Strikeouts': "Batter Strikeouts", 'Walks': "Walks Allowed", 'Bases': "Total Bases",
+        '1st 2 Maps Kills': "Kills on Map 1+2", '1st 2 Maps  Kills': "Kills on Map 1+2", 'Made Threes': "3-Pointers Made",
+        'Points + Rebounds + Assists': "Pts + Rebs + Asts", 'Earned Runs': "Earned Runs Allowed",
+        'Passing Completions': "Completions", 'Longest Passing Completion': "Longest Completion",
+        'Passing Touchdowns': "Passing TDs",
+    },
+    'vividpicks': {
+        'TotalBases': "Total Bases", 'RunsBattedIn': "RBIs", 'PitchingStrikeouts': "Strikeouts",
+        'ReceivingYards': "Receiving Yards", 'RushingYards': "Rushing Yards", 'PassingYards': "Passing Yards",
+        'ReceivingTouchdowns': "Receiving TDs", 'Receiving Tds': "Receiving TDs", 'Pts + Ast': "Points + Assists",
+        '3PT Made': "3-Pointers Made", 'Shots OnTarget': "Shots on Target", 'Points + Rebounds + Assists': "Pts + Rebs + Asts",
+        'Pts + Reb': "Points + Rebounds", 'Interceptions Thrown': "Interceptions", 'Field Goals Made': "FG Made",
+        'Shot Attempts': "Shots Attempted", 'Passing Tds': "Passing TDs", 'RushingTouchdowns': "Rushing TDs",
+        'Reb + Ast': "Rebounds + Assists", 'Rushing Touchdowns': "Rushing TDs", 'PassingTouchdowns': "Passing TDs",
+        'Total Tackles': "Tackles", 'Kills Gm 1-3': "Kills on Maps 1-3", 'Earned Runs': "Earned Runs Allowed",
+        'Pass Attempts': "Passing Attempts", 'Rush Attempts': "Rushing Attempts",
+    },
+    'sleeper': {
+        # Basketball
+        'fantasy_points': "Fantasy Points", 'blocks': "Blocks", 'steals': "Steals", 'assists': "Assists", 'points': "Points",
+        'rebounds': "Rebounds", 'turnovers': "Turnovers", 'threes_made': "3-Pointers Made", 'points_rebounds': "Points + Rebounds",
+        'points_and_rebounds': "Points + Rebounds", 'points_and_assists': "Points + Assists",
+        'rebounds_and_assists': "Rebounds + Assists", 'pts_reb_ast': "Pts + Rebs + Asts", 'blocks_and_steals': "Blocks + Steals",
+        # Baseball
+        'hits_runs_rbis': "Hits + Runs + RBIs", 'strike_outs': "Strikeouts", 'doubles': "Doubles",
+        'hits_allowed': "Hits Allowed", 'bat_strike_outs': "Batter Strikeouts", 'earned_runs': "Earned Runs Allowed",
+        'first_inning_runs': "1st Inn. Runs Allowed", 'hits': "Hits", 'runs': "Runs", 'walks': "Walks Allowed",
+        'bat_walks': "Batter Walks", 'rbis': "RBIs", 'home_runs': "Home Runs", 'singles': "Singles",
+        'total_bases': "Total Bases", 'outs': "Pitching Outs", 'stolen_bases': "Stolen Bases",
+    },
+    # Underdog titles are split on these phrases too, see UnderdogScraper.prop_segmenter
+    'underdog': {},
+}
+
+class PropRegistry:
+    """Resolves each book's raw market identifiers to one interned canonical prop name
+
+    The alias tables are compiled once, so resolving a market is a single dict lookup and
+    every book's rows share the same string object for a prop. Markets that resolve to
+    nothing are counted per book until the next cycle collects them.
+    """
+
+    def __init__(self, canonical_props, book_aliases):
+        self.canonical = {prop: sys.intern(prop) for prop in canonical_props}
+        self.tables = {}
+        for sportbook, aliases in book_aliases.items():
+            # An alias pointing at a prop that isn't canonical fails here instead of silently missing the join
+            unknown = set(aliases.values()) - self.canonical.keys()
+            if unknown:
+                raise ValueError(f"{sportbook} aliases props that aren't canonical: {', '.join(sorted(unknown))}")
+            self.tables[sportbook] = {**self.canonical, **{raw: self.canonical[prop] for raw, prop in aliases.items()}}
+        self.aliases = book_aliases
+        self._lock = threading.Lock()
+        self._unmapped = {}  # book -> Counter of raw markets seen since the last collect
+
+    def resolve(self, sportbook, market):
+        """Returns the canonical prop for a book's raw market, or the market itself if it isn't mapped"""
+        prop = self.tables.get(sportbook, self.canonical).get(market)
+        if prop is not None:
+            return prop
+        with self._lock:
+            self._unmapped.setdefault(sportbook, Counter())[market] += 1
+        return market
+
+    def markets(self, sportbook):
+        """Returns the raw market identifiers a book has aliases for"""
+        return list(self.aliases.get(sportbook, {}))
+
+    def phrases(self, sportbook):
+        """Returns every prop name a book's raw markets can be spelled as"""
+        return [*self.canonical, *self.aliases.get(sportbook, {})]
+
+    def report_unmapped(self, sportbook):
+        """Prints and returns the book's unmapped markets since the last call"""
+        markets = self.collect_unmapped(sportbook)
+        if markets:
+            print(f"{sportbook} has {len(markets)} unmapped markets: {', '.join(sorted(markets))}")
+        return markets
+
+    def collect_unmapped(self, sportbook):
+        """Returns {raw market: rows} for the book's unmapped markets since the last call and resets them"""
+        with self._lock:
+            return dict(self._unmapped.pop(sportbook, {}))
+
+# Built once and shared by every scraper in the process
+prop_registry = PropRegistry(CANONICAL_PROPS, BOOK_ALIASES)
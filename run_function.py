@@ -1,7 +1,35 @@
 import subprocess
 import os
+import sys
 import time
 
+def run_pipeline_mode():
+    """Runs every cycle in this process and persists to MySQL in the background"""
+    from pipeline import run_pipeline, DatabaseSink
+    sink = DatabaseSink()
+    while True:
+        run_pipeline(sink=sink)
+        print("Pipeline cycle has completed.")
+        time.sleep(600)
+
+def run_scheduler_mode():
+    """Polls each book on its own interval and analyzes as soon as any book has new data"""
+    from pipeline import DatabaseSink
+    from scheduler import scheduler_from_env
+    scheduler_from_env(sink=DatabaseSink()).run_forever()
+
+def run_daemon_mode():
+    """Runs the scheduler in one warm process with a local control interface"""
+    from daemon import main as run_daemon
+    run_daemon()
+
+if '--pipeline' in sys.argv:
+    run_pipeline_mode()
+elif '--scheduler' in sys.argv:
+    run_scheduler_mode()
+elif '--daemon' in sys.argv:
+    run_daemon_mode()
+
 while True:
     # Get the current working directory
     base_dir = os.getcwd()
@@ -30,5 +58,3 @@ while True:
     # All processes are done
     print("All scripts have completed.")
     time.sleep(600)
-
-    
\ No newline at end of file
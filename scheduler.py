@@ -0,0 +1,183 @@
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from main import analyze, order_sportsbooks, report_unmapped_props, SPORTSBOOKS
+from pipeline import fetch_units, fetch_unit, unit_book, to_batch, stack_batches, pipeline_books, DatabaseSink
+from planner import planner_from_env
+from httpcache import http_cache
+
+logger = logging.getLogger(__name__)
+
+def parse_intervals(value):
+    """Parses 'book=seconds,book=seconds' into a dict"""
+    intervals = {}
+    for item in filter(None, (value or '').split(',')):
+        book, seconds = item.split('=')
+        intervals[book.strip()] = float(seconds)
+    return intervals
+
+class Scheduler:
+    """Polls each book (or each league of a league-aware book) on its own interval and re-runs the analysis as soon as any of them publishes new data"""
+
+    def __init__(self, books, intervals=None, default_interval=600, jitter=30, deadline=120, max_staleness=1800, sink=None, planner=None):
+        self.books = books
+        self.units = fetch_units(books)
+        self.intervals = intervals or {}
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.deadline = deadline
+        self.max_staleness = max_staleness
+        self.sink = sink
+        self.planner = planner
+
+        # One worker per unit so a hung scraper only ever blocks its own unit, a unit is never
+        # fetched again while its abandoned fetch still holds the thread
+        self.executor = ThreadPoolExecutor(max_workers=len(self.units))
+        self.running = {}  # unit -> (future, started_at)
+        self.abandoned = {}  # unit -> future of a fetch that missed its deadline and hasn't returned yet
+        self.rows = {}  # unit -> latest rows, a book is persisted from all of its units
+        self.board = {}  # unit -> latest typed batch
+        self.fetched_at = {}  # unit -> time of the last successful fetch
+        self.next_due = {unit: time.monotonic() for unit in self.units}
+        self.analyses = 0
+        self.last_analysis = None
+        self.unmapped = {}  # unit -> unmapped markets from its last new board
+
+    def interval(self, unit):
+        """Returns the poll interval for a unit with random jitter applied"""
+        base = self.intervals.get(unit, self.intervals.get(unit_book(unit), self.default_interval))
+        if self.planner:
+            base = self.planner.interval(unit, base)
+
+        # Keep the jitter small relative to short near-start intervals
+        jitter = min(self.jitter, base / 4)
+        return max(0.0, base + random.uniform(-jitter, jitter))
+
+    def submit_due(self, now):
+        """Starts a fetch for every unit that is due and not already running"""
+        for unit in self.units:
+            if unit not in self.running and unit not in self.abandoned and now >= self.next_due[unit]:
+                self.running[unit] = (self.executor.submit(fetch_unit, unit, self.deadline), now)
+
+    def book_rows(self, sportbook):
+        """Returns a book's latest rows across all of its units"""
+        return [data for unit, rows in self.rows.items() if unit_book(unit) == sportbook for data in rows]
+
+    def collect(self, now):
+        """Stores finished fetches and returns True if any unit published new data"""
+        updated = False
+        for unit, future in list(self.abandoned.items()):
+            # The thread is free again, so the unit is polled right away instead of waiting a whole interval
+            if future.done():
+                logger.info(f"{unit} abandoned fetch has returned, polling it again")
+                del self.abandoned[unit]
+                self.next_due[unit] = now
+
+        for unit, (future, started_at) in list(self.running.items()):
+            if not future.done():
+                # Past the deadline the unit is analyzed with its last batch and the fetch's rows are dropped
+                if now - started_at > self.deadline:
+                    logger.warning(f"{unit} missed its {self.deadline}s deadline, abandoning the fetch")
+                    del self.running[unit]
+                    self.abandoned[unit] = future
+                continue
+
+            del self.running[unit]
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Error scraping {unit}: {e}")
+                results = {}
+
+            for name, output_data in results.items():
+                # An unchanged board is still fresh but needs no rebuild, write or re-analysis
+                if name in self.board and not http_cache.changed(name):
+                    self.fetched_at[name] = now
+                    continue
+
+                sportbook = unit_book(name)
+                if self.planner:
+                    self.planner.observe(name, output_data)
+                self.rows[name] = output_data
+                self.board[name] = to_batch(sportbook, output_data)
+                self.fetched_at[name] = now
+                self.unmapped[name] = report_unmapped_props([sportbook])[sportbook]
+                if self.sink:
+                    # The book's snapshot is replaced as a whole, so it's written with every league's rows
+                    self.sink.submit(sportbook, self.book_rows(sportbook))
+                updated = True
+
+            # Plan the next poll after the start times have been observed
+            self.next_due[unit] = now + self.interval(unit)
+        return updated
+
+    def staleness(self):
+        """Returns the seconds since each unit's last successful fetch (None if it never succeeded)"""
+        now = time.monotonic()
+        return {unit: (now - self.fetched_at[unit]) if unit in self.fetched_at else None for unit in self.units}
+
+    def analyze_board(self):
+        """Runs the analysis on every unit whose data isn't too stale, even if some units are late"""
+        staleness = self.staleness()
+        batches = [batch for unit, batch in self.board.items()
+                   if staleness.get(unit) is not None and staleness[unit] <= self.max_staleness]
+        long_df = stack_batches(batches)
+        if long_df.empty:
+            return
+        analyze(long_df, order_sportsbooks(SPORTSBOOKS, long_df))
+        self.analyses += 1
+        self.last_analysis = time.time()
+
+    def trigger(self, books=None):
+        """Makes the given books or units (or every unit) due on the next tick"""
+        now = time.monotonic()
+        for unit in self.units:
+            if not books or unit in books or unit_book(unit) in books:
+                self.next_due[unit] = now
+
+    def status(self):
+        """Returns the running, late and next-due state of every unit"""
+        now = time.monotonic()
+        return {
+            'running': sorted(self.running),
+            'late': sorted(self.abandoned),
+            'staleness': self.staleness(),
+            'next_due_in': {unit: max(0.0, due - now) for unit, due in self.next_due.items()},
+            'analyses': self.analyses,
+            'last_analysis': self.last_analysis,
+            'unmapped': self.unmapped,
+        }
+
+    def tick(self):
+        """Runs one scheduling step"""
+        now = time.monotonic()
+        self.submit_due(now)
+        if self.collect(now):
+            try:
+                self.analyze_board()
+            except Exception as e:
+                logger.exception(f"Error analyzing board: {e}")
+
+    def run_forever(self, tick_seconds=1.0):
+        """Runs the scheduler until the process is stopped"""
+        while True:
+            self.tick()
+            time.sleep(tick_seconds)
+
+def scheduler_from_env(sink=None):
+    """Builds a scheduler configured with POLL_INTERVALS, POLL_INTERVAL, POLL_JITTER, SCRAPER_DEADLINE, MAX_STALENESS and the planner"""
+    return Scheduler(
+        pipeline_books(),
+        intervals=parse_intervals(os.getenv("POLL_INTERVALS")),
+        default_interval=float(os.getenv("POLL_INTERVAL", 600)),
+        jitter=float(os.getenv("POLL_JITTER", 30)),
+        deadline=float(os.getenv("SCRAPER_DEADLINE", 120)),
+        max_staleness=float(os.getenv("MAX_STALENESS", 1800)),
+        sink=sink,
+        planner=planner_from_env(),
+    )
+
+if __name__ == '__main__':
+    scheduler_from_env(sink=DatabaseSink()).run_forever()
@@ -0,0 +1,199 @@
+import os
+import time
+
+# Odds tables written by the scrapers, one row per (player, prop, stat_value)
+DATA_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS {table_name} (
+    player VARCHAR(100) NOT NULL,
+    prop VARCHAR(100) NOT NULL,
+    stat_value FLOAT NOT NULL,
+    over_multi FLOAT,
+    under_multi FLOAT,
+    PRIMARY KEY (player, prop, stat_value)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+'''
+
+# Discrepancy tables written by main.py, one row per (player, prop, stat_value, o/u)
+RESULTS_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS {table_name} (
+    player VARCHAR(100) NOT NULL,
+    prop VARCHAR(100) NOT NULL,
+    stat_value FLOAT NOT NULL,
+    `o/u` CHAR(1) NOT NULL,
+    top_sb VARCHAR(32),
+    top_multi FLOAT,
+    low_sb VARCHAR(32),
+    low_multi FLOAT,
+    spread FLOAT,
+    avg_multi FLOAT,
+    PRIMARY KEY (player, prop, stat_value, `o/u`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+'''
+
+# Idempotent insert for the odds tables so duplicate rows from a feed overwrite instead of failing
+DATA_UPSERT_QUERY = '''
+INSERT INTO {table_name} (player, prop, stat_value, over_multi, under_multi)
+VALUES (%s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE over_multi=VALUES(over_multi), under_multi=VALUES(under_multi)
+'''
+
+# Unified long-format odds table used when ODDS_STORAGE=unified, one row per book and prop
+ODDS_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS odds (
+    book VARCHAR(32) NOT NULL,
+    cycle_id BIGINT NOT NULL,
+    player VARCHAR(100) NOT NULL,
+    prop VARCHAR(100) NOT NULL,
+    stat_value FLOAT NOT NULL,
+    over_multi FLOAT,
+    under_multi FLOAT,
+    PRIMARY KEY (book, player, prop, stat_value),
+    KEY book_cycle (book, cycle_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+'''
+
+ODDS_UPSERT_QUERY = '''
+INSERT INTO odds (book, cycle_id, player, prop, stat_value, over_multi, under_multi)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE cycle_id=VALUES(cycle_id), over_multi=VALUES(over_multi), under_multi=VALUES(under_multi)
+'''
+
+DATA_COLUMNS = ['player', 'prop', 'stat_value', 'over_multi', 'under_multi']
+ODDS_COLUMNS = ['book', 'player', 'prop', 'stat_value', 'over_multi', 'under_multi']
+RESULTS_COLUMNS = ['player', 'prop', 'stat_value', '`o/u`', 'top_sb', 'top_multi', 'low_sb', 'low_multi', 'spread', 'avg_multi']
+
+def create_data_table(cursor, table_name):
+    """Creates a <book>_data table keyed on (player, prop, stat_value)"""
+    cursor.execute(DATA_TABLE_QUERY.format(table_name=table_name))
+
+def create_results_table(cursor, table_name):
+    """Creates a <book>_results table keyed on (player, prop, stat_value, o/u)"""
+    cursor.execute(RESULTS_TABLE_QUERY.format(table_name=table_name))
+
+def unified_storage():
+    """Checks if the scrapers and main.py should use the single odds table instead of <book>_data tables"""
+    return os.getenv("ODDS_STORAGE", "tables").lower() == "unified"
+
+def null_nan(value):
+    """Replaces a NaN multiplier with None so it's stored as NULL"""
+    return None if value != value else value
+
+def data_rows(output_data):
+    """Converts a sportsbook's rows into (player, prop, stat_value, over_multi, under_multi) tuples"""
+    return [(data['player'], data['prop'], data['stat_value'], null_nan(data['over_multi']), null_nan(data['under_multi']))
+            for data in output_data]
+
+class UnifiedSnapshot:
+    """Writes a sportsbook's rows to the odds table as a new scrape cycle, in one transaction"""
+
+    def __init__(self, cursor, conn, sportbook, batch_size=1000):
+        self.cursor = cursor
+        self.conn = conn
+        self.sportbook = sportbook
+        self.batch_size = batch_size
+        self.cycle_id = time.time_ns() // 1_000_000
+        cursor.execute(ODDS_TABLE_QUERY)
+
+    def write(self, output_data):
+        """Upserts a batch of rows into the new cycle"""
+        rows = [(self.sportbook, self.cycle_id, *row) for row in data_rows(output_data)]
+        for start in range(0, len(rows), self.batch_size):
+            self.cursor.executemany(ODDS_UPSERT_QUERY, rows[start:start + self.batch_size])
+
+    def commit(self):
+        """Removes whatever the previous cycles left behind and commits"""
+        self.cursor.execute("DELETE FROM odds WHERE book=%s AND cycle_id<>%s", (self.sportbook, self.cycle_id))
+        self.conn.commit()
+
+    def discard(self):
+        """Drops the rows of a cycle that will never be committed"""
+        self.conn.rollback()
+        self.cursor.execute("DELETE FROM odds WHERE book=%s AND cycle_id=%s", (self.sportbook, self.cycle_id))
+        self.conn.commit()
+
+class DataTableSnapshot:
+    """Bulk loads rows into a shadow table and atomically swaps it in as the live <book>_data table"""
+
+    def __init__(self, cursor, conn, table_name, batch_size=1000):
+        self.cursor = cursor
+        self.conn = conn
+        self.table_name = table_name
+        self.shadow_table = f"{table_name}_shadow"
+        self.batch_size = batch_size
+
+        # Build the new snapshot next to the live table
+        cursor.execute(f"DROP TABLE IF EXISTS {self.shadow_table}")
+        create_data_table(cursor, self.shadow_table)
+        create_data_table(cursor, table_name) # make sure there is a live table to swap with
+
+    def write(self, output_data):
+        """Loads a batch of rows into the shadow table"""
+        # executemany collapses each batch into a single multi-row INSERT
+        rows = data_rows(output_data)
+        for start in range(0, len(rows), self.batch_size):
+            self.cursor.executemany(DATA_UPSERT_QUERY.format(table_name=self.shadow_table), rows[start:start + self.batch_size])
+        self.conn.commit()
+
+    def commit(self):
+        """Swaps the tables atomically so readers always see a complete snapshot"""
+        self.cursor.execute(f"DROP TABLE IF EXISTS {self.table_name}_old")
+        self.cursor.execute(f"RENAME TABLE {self.table_name} TO {self.table_name}_old, {self.shadow_table} TO {self.table_name}")
+        self.cursor.execute(f"DROP TABLE {self.table_name}_old")
+
+    def discard(self):
+        """Drops a shadow table that will never be swapped in"""
+        self.cursor.execute(f"DROP TABLE IF EXISTS {self.shadow_table}")
+
+def open_snapshot(cursor, conn, sportbook):
+    """Starts a new snapshot of a sportsbook's rows in whichever storage mode is configured"""
+    if unified_storage():
+        return UnifiedSnapshot(cursor, conn, sportbook)
+    return DataTableSnapshot(cursor, conn, f'{sportbook}_data')
+
+def publish_odds(cursor, conn, sportbook, output_data):
+    """Publishes a sportsbook's rows to whichever storage mode is configured"""
+    snapshot = open_snapshot(cursor, conn, sportbook)
+    snapshot.write(output_data)
+    snapshot.commit()
+
+def needs_migration(cursor, table_name):
+    """Checks if a table still uses the old AUTO_INCREMENT id layout"""
+    cursor.execute(f"SHOW COLUMNS FROM {table_name} LIKE 'id'")
+    return cursor.fetchone() is not None
+
+def migrate_table(cursor, conn, table_name, table_query, columns):
+    """Copies an old id-keyed table into the keyed layout and swaps it in"""
+    column_list = ', '.join(columns)
+
+    # Build the new table next to the old one and copy the rows over, keeping the first copy of any duplicates
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name}_migrated")
+    cursor.execute(table_query.format(table_name=f"{table_name}_migrated"))
+    cursor.execute(f"INSERT IGNORE INTO {table_name}_migrated ({column_list}) SELECT {column_list} FROM {table_name} ORDER BY id")
+
+    # Swap the tables atomically so readers never see a missing table
+    cursor.execute(f"RENAME TABLE {table_name} TO {table_name}_old, {table_name}_migrated TO {table_name}")
+    cursor.execute(f"DROP TABLE {table_name}_old")
+    conn.commit()
+
+def migrate():
+    """One-time migration of existing *_data and *_results tables to the keyed schema"""
+    from database import connect_to_sql
+
+    with connect_to_sql() as (cursor, conn):
+        cursor.execute("SHOW TABLES")
+        tables = [row[0] for row in cursor.fetchall()]
+
+        for table_name in tables:
+            if table_name.endswith('_data'):
+                table_query, columns = DATA_TABLE_QUERY, DATA_COLUMNS
+            elif table_name.endswith('_results'):
+                table_query, columns = RESULTS_TABLE_QUERY, RESULTS_COLUMNS
+            else:
+                continue
+
+            if needs_migration(cursor, table_name):
+                migrate_table(cursor, conn, table_name, table_query, columns)
+                print(f"Migrated {table_name}")
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,26 @@
+import os
+import sys
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from jsonstream import JsonStream, byte_chunks
+
+DOCUMENT = json.dumps({
+    'version': 1.25,
+    'players': [
+        {'id': 1, 'name': 'Ronald Acuña Jr.', 'line': -0.5, 'price': 1.8e0, 'odds': [1.77, 2.05e-1], 'live': True},
+        {'id': 22, 'name': 'Pete Alonso', 'line': 10, 'price': 12e3, 'odds': [], 'live': False, 'note': None},
+    ],
+    'count': 2,
+}, ensure_ascii=False, separators=(',', ':')).encode()
+
+def test_members_at_every_chunk_size():
+    expected = json.loads(DOCUMENT)
+    for size in range(1, len(DOCUMENT) + 1):
+        document, players = {}, []
+        for key, value in JsonStream(byte_chunks(DOCUMENT, size)).members(streamed={'players'}):
+            if key == 'players':
+                players.append(value)
+            else:
+                document[key] = value
+        assert {**document, 'players': players} == expected, f'chunk size {size}'
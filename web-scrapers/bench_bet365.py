@@ -0,0 +1,60 @@
+import re
+import os
+import sys
+import glob
+import timeit
+from bet365 import parse, fraction_to_multiplier
+
+# Usage: python3 bench_bet365.py <dir of payloads recorded with BET365_RECORD_DIR>
+
+# The previous parser converted odds without the cache
+uncached_multiplier = fraction_to_multiplier.__wrapped__
+
+def regex_parse(data, prop_name):
+    """The previous regex parser (and its uncached odds conversion), kept to compare speed and output against"""
+    players, stat_values, prop, over_odds, under_odds = [], [], prop_name, [], []
+    segments = re.split(r'SY=fe', data)
+    for segment in segments[1:]:
+        name_pattern = re.compile(r"NA=(?!Over|Under)(?![^;]*@)([^;]+);")
+        player_names = name_pattern.findall(segment)
+        if ' ' in player_names:
+            player_names.remove(' ')
+        for name in player_names:
+            players.append(name.replace('  ', ' '))
+
+        overPattern = re.compile(r'\|MA;ID=[^;]+;NA=Over.*?(?=\|MA;ID=[^;]+;NA=Under|\|MG|\Z)', re.DOTALL)
+        underPattern = re.compile(r'\|MA;ID=[^;]+;NA=Under.*?(?=\|MA|\|MG|\Z)', re.DOTALL)
+        overMatch = overPattern.search(segment)
+        underMatch = underPattern.search(segment)
+        if overMatch and underMatch:
+            lines_pattern = re.compile(r'HD=([\d\.]+)')
+            odds_pattern = re.compile(r'OD=([\d/]+)')
+            stat_values.extend(lines_pattern.findall(overMatch.group(0)))
+            over_odds.extend(odds_pattern.findall(overMatch.group(0)))
+            under_odds.extend(odds_pattern.findall(underMatch.group(0)))
+
+    stat_values = [float(i) for i in stat_values]
+    over_multi_list = [uncached_multiplier(over) for over in over_odds]
+    under_multi_list = [uncached_multiplier(under) for under in under_odds]
+    return [{'player': player, 'prop': prop, 'stat_value': stat, 'over_multi': over_multi, 'under_multi': under_multi}
+            for player, stat, over_multi, under_multi in zip(players, stat_values, over_multi_list, under_multi_list)]
+
+def benchmark(payload_dir, number=50):
+    payloads = {}
+    for path in sorted(glob.glob(os.path.join(payload_dir, '*.txt'))):
+        with open(path) as f:
+            payloads[os.path.basename(path)] = f.read()
+    if not payloads:
+        print(f"No recorded payloads in {payload_dir}")
+        return
+
+    for name, data in payloads.items():
+        if parse(data, name) != regex_parse(data, name):
+            print(f"{name}: output differs from the regex parser")
+
+    for label, parser in (('regex', regex_parse), ('tokenizer', parse)):
+        seconds = timeit.timeit(lambda: [parser(data, name) for name, data in payloads.items()], number=number)
+        print(f"{label}: {seconds / number * 1000:.2f} ms per cycle of {len(payloads)} payloads")
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else os.getenv("BET365_RECORD_DIR", '.'))
@@ -1,62 +1,75 @@
 from curl_cffi import requests
 import json
-import unicodedata
-import mysql.connector
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-from dotenv import load_dotenv
-
-@contextmanager
-def connect_to_sql():
-    """Connects to the SQL using contextmanager to efficiently manage the connection and cursor"""
-    conn = None
-    try:
-        # Load the .env file
-        load_dotenv()
-
-        # Connect to the MySQL database
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
-        cursor = conn.cursor()
-        yield cursor, conn  # Yield both cursor and connection to use inside the `with` block
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-    finally: # close cursor and conn after usage
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close() 
-
-def create_table(cursor, table_name):
-    """Creates a new table in the MySQL database """
-    # Drop the table if it already exists
-    drop_table_query = f'DROP TABLE IF EXISTS {table_name}'
-    # Create the table
-    create_table_query = f'''
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        player VARCHAR(255),
-        prop VARCHAR(255),
-        stat_value FLOAT,
-        over_multi FLOAT,
-        under_multi FLOAT
-    )
-    '''
-    cursor.execute(drop_table_query)
-    cursor.execute(create_table_query)
-
-def insert_data(cursor, data, table_name):
-    """Inserts data into the MySQL database"""
-    cursor.execute(
-        f'INSERT INTO {table_name} (player, prop, stat_value, over_multi, under_multi) VALUES (%s, %s, %s, %s, %s)',
-        (data['player'], data['prop'], data['stat_value'], data['over_multi'], data['under_multi'])
-    )
-
-def scrape_prizepicks():
+import sys
+from contextlib import ExitStack
+
+# Allow importing the shared modules from the repository root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from schema import publish_odds, open_snapshot
+from database import connect_to_sql
+from httpcache import http_cache, cache_key, fetch_name
+from jsonstream import JsonStream
+from props import prop_registry
+from player_index import normalize_name
+
+# PrizePicks league ids, PRIZEPICKS_LEAGUES picks the ones to scrape (names or raw ids)
+PRIZEPICKS_LEAGUES = {'mlb': '2', 'nba': '7'}
+
+def prizepicks_tier_multipliers():
+    """Parses PRIZEPICKS_TIER_MULTIPLIERS ('goblin=1.5,demon=2.5') on top of the standard 1.77"""
+    multipliers = {'standard': 1.77}
+    for item in filter(None, os.getenv("PRIZEPICKS_TIER_MULTIPLIERS", '').split(',')):
+        odds_type, multiplier = item.split('=')
+        multipliers[odds_type.strip()] = float(multiplier)
+    return multipliers
+
+def prizepicks_has_next(data):
+    """Returns whether a page of projections says there is another page"""
+    if data.get('links', {}).get('next'):
+        return True
+    meta = data.get('meta', {})
+    return bool(data['data']) and meta.get('current_page', 1) < meta.get('total_pages', 1)
+
+def parse_prizepicks_page(data, tier_multipliers):
+    """Converts one page of projections into output rows
+
+    Goblin and demon projections are kept as their own rows, with the tier in odds_type and the
+    multiplier PRIZEPICKS_TIER_MULTIPLIERS gives it (NaN when the tier's payout isn't configured).
+    """
+    # Index the players once instead of scanning 'included' for every projection
+    players = {}
+    for player in data.get('included', []):
+        if player['type'] == 'new_player':
+            players[player['id']] = normalize_name(player['attributes']['name'])
+
+    output_data = []
+    for projection in data['data']:
+        player_name = players.get(projection['relationships']['new_player']['data']['id'])
+        if player_name is None:
+            continue
+
+        attributes = projection['attributes']
+        odds_type = attributes.get('odds_type', 'standard')
+        multiplier = tier_multipliers.get(odds_type, float('nan'))
+
+        output_data.append({
+            'player': player_name,
+            'prop': prop_registry.resolve('prizepicks', attributes['stat_type']),
+            'stat_value': attributes['line_score'],
+            'over_multi': multiplier,
+            'under_multi': multiplier,
+            'start_time': attributes.get('start_time'),
+            'odds_type': odds_type,
+        })
+    return output_data
+
+def prizepicks_leagues():
+    """Returns the leagues to scrape, configurable with PRIZEPICKS_LEAGUES"""
+    return [league.strip() for league in os.getenv("PRIZEPICKS_LEAGUES", 'nba').split(',')]
+
+def scrape_prizepicks(leagues=None, export=True):
     headers = {
         'sec-ch-ua': '"Not)A;Brand";v="99", "Google Chrome";v="127", "Chromium";v="127"',
         'X-Device-Info': 'name=,os=mac,osVersion=10.15.7,isSimulator=false,platform=web,appVersion=web,fbp=fb.1.1723660011058.49143379871310946',
@@ -68,110 +81,118 @@ def scrape_prizepicks():
         'X-Device-ID': '<device id>',
         'sec-ch-ua-platform': '"macOS"',
     }
-    # mlb
-    # params = {
-    #     'league_id': '2',
-    #     'per_page': '1000',
-    #     'single_stat': 'true',
-    #     'state_code': 'OR',
-    #     'game_mode': 'prizepools',
-    # }
-    # nba
-    params = {
-        'league_id': '7',
-        'per_page': '1000',
-        'single_stat': 'true',
-        'state_code': 'OR',
-        'game_mode': 'prizepools',
-    }
     url = 'https://api.prizepicks.com/projections'
-    response = requests.get(url, params=params, headers=headers)
-    output_data = []
+    # A fetch of only some leagues (the scheduler polls each league on its own) is cached apart
+    fetch = http_cache.fetch(fetch_name('prizepicks', leagues))
+    leagues = leagues or prizepicks_leagues()
+    tier_multipliers = prizepicks_tier_multipliers()
+    timeout = float(os.getenv("PRIZEPICKS_TIMEOUT", 15))
 
-    try:
-        data = response.json()
-        newPlayers = data['included']
-        projections = data['data']
-        
-        propMap = {"Hitter Fantasy Score": "Fantasy Points", "Hits+Runs+RBIs": "Hits + Runs + RBIs", "Pitcher Strikeouts": "Strikeouts",
-                "Pitcher Fantasy Score": "Fantasy Points", "Hitter Strikeouts": "Batter Strikeouts", "Pts+Rebs+Asts": "Pts + Rebs + Asts",
-                "Pts+Asts": "Points + Assists", "Pts+Rebs": "Points + Rebounds", "Rebs+Asts": "Rebounds + Assists", "Blks+Stls": "Blocks + Steals", 
-                "3-PT Made": "3-Pointers Made",}
-        for projection in projections:
-            # Extract the player ID
-            player_id = projection['relationships']['new_player']['data']['id']
-            
-            # Extract the player's name (using the 'new_player' relationship)
-            player_name = None
-            for player in newPlayers:
-                if player['id'] == player_id and player['type'] == 'new_player':
-                    player_name = player['attributes']['name']
-                    normalized_name = unicodedata.normalize('NFKD', player_name).encode('ascii', 'ignore').decode('ascii')
-                    break
-            
-            # Extract and append player prop details if standard multiplier
-            if projection['attributes']['odds_type'] == 'standard':
-                stat_type = projection['attributes']['stat_type']
-                prop_name = propMap.get(stat_type, stat_type)
-                line_score = projection['attributes']['line_score']
-                output_data.append({
-                    'player': normalized_name,
-                    'prop': prop_name,
-                    'stat_value': line_score,
-                    'over_multi': 1.77,
-                    'under_multi': 1.77
-                })
-    except Exception as e:
-        print("Error scraping PrizePicks data: ", e)
-
-    # Save the JSON response to an output file
-    output_dir = os.getenv("OUTPUT_DIR")
-    output_file = os.path.join(output_dir, 'prizepicks_output.json')
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
-
-    # Export data to MySQL
-    with connect_to_sql() as (cursor, conn):
-        create_table(cursor, 'prizepicks_data')
-        for data in output_data:
-            insert_data(cursor, data, 'prizepicks_data')
-        conn.commit()
-
-def scrape_parlayplay():
-    headers = {
-        'sec-ch-ua': '"Not)A;Brand";v="99", "Google Chrome";v="127", "Chromium";v="127"',
-        'X-ParlayPlay-Platform': 'web',
-        'X-Parlay-Request': '1',
-        'sec-ch-ua-mobile': '?0',
-        'User-Agent': '<user agent>',
-        'Accept': 'application/json, text/plain, */*',
-        'Referer': 'https://parlayplay.io/challenges/crossgame/search',
-        'X-Requested-With': 'XMLHttpRequest',
-        'X-CSRFToken': '<csrf token>',
-        'sec-ch-ua-platform': '"macOS"',
-    }
+    def parse_page(body):
+        data = json.loads(body)
+        return parse_prizepicks_page(data, tier_multipliers), prizepicks_has_next(data)
+
+    def scrape_league(league_id):
+        output_data = []
+        session = requests.Session() # keep-alive across this league's pages
+        page = 1
+        while True:
+            params = {
+                'league_id': league_id,
+                'per_page': '1000',
+                'page': str(page),
+                'single_stat': 'true',
+                'state_code': 'OR',
+                'game_mode': 'prizepools',
+            }
+            key = cache_key(url, params)
+            response = session.get(url, params=params, headers={**headers, **fetch.conditional_headers(key)}, timeout=timeout)
+            # The pagination answer is cached with the rows so an unchanged page still knows if there's more
+            rows, has_next = fetch.resolve(key, response.status_code, response.headers, response.content, parse_page)
+            output_data.extend(rows)
+            if not has_next:
+                return output_data
+            page += 1
 
-    params = {
-        'sport': 'All',
-        'league': '',
-        'includeAlt': 'true',
-    }
-    url = 'https://parlayplay.io/api/v1/crossgame/search/'
-    response = requests.get(url, params=params, headers=headers)
-    data = response.json()
-    players = data['players']
     output_data = []
-    propMap = {
-    'Fantasy Score': 'Fantasy Points', 'Batting Walks': 'Batter Walks', 'Outs': 'Pitching Outs',
-    'Batting Strikeouts': 'Batter Strikeouts', 'Walks': 'Walks Allowed', 'Bases': 'Total Bases', 
-    '1st 2 Maps Kills': '1st 2 Maps Player Kills', 'Made Threes': '3-Pointers Made', 
-    'Points + Rebounds + Assists': 'Pts + Rebs + Asts', "Earned Runs": "Earned Runs Allowed",
-    "1st 2 Maps  Kills": "Kills on Map 1+2", "Passing Completions": "Completions",
-    "Longest Passing Completion": "Longest Completion", "Passing Touchdowns": "Passing TDs"}
-
-    for player in players:
+    with ThreadPoolExecutor(max_workers=len(leagues)) as executor:
+        futures = {executor.submit(scrape_league, PRIZEPICKS_LEAGUES.get(league, league)): league for league in leagues}
+        for future in as_completed(futures):
+            try:
+                output_data.extend(future.result())
+            except Exception as e:
+                print(f"Error scraping PrizePicks {futures[future]} data: ", e)
+
+    # The tables are keyed on (player, prop, stat_value), so a tier on a standard line would overwrite it
+    standard = {(data['player'], data['prop'], data['stat_value']) for data in output_data if data['odds_type'] == 'standard'}
+    output_data = [data for data in output_data
+                   if data['odds_type'] == 'standard' or (data['player'], data['prop'], data['stat_value']) not in standard]
+
+    # Skip the exports when the rows are handed straight to the analysis or nothing changed
+    if fetch.finish() and export:
+        # Save the JSON response to an output file
+        output_dir = os.getenv("OUTPUT_DIR")
+        output_file = os.path.join(output_dir, 'prizepicks_output.json')
+        with open(output_file, 'w') as f:
+            json.dump(output_data, f, indent=2)
+
+        # Export data to MySQL
+        with connect_to_sql() as (cursor, conn):
+            publish_odds(cursor, conn, 'prizepicks', output_data)
+
+    # Report the markets this run couldn't map (the pipeline and scheduler collect them instead)
+    if export:
+        prop_registry.report_unmapped('prizepicks')
+
+    return output_data
+
+class StreamingSnapshot:
+    """Writes a book's rows to a new snapshot in batches as they're parsed, discarding it unless it's committed"""
+
+    def __init__(self, sportbook, batch_size):
+        self.sportbook = sportbook
+        self.batch_size = batch_size
+        self.buffer = []
+        self.stack = ExitStack()
+        self.snapshot = None
+
+    def add(self, data):
+        self.buffer.append(data)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # The connection is only checked out once there are rows to write
+        if self.snapshot is None:
+            cursor, conn = self.stack.enter_context(connect_to_sql())
+            self.snapshot = open_snapshot(cursor, conn, self.sportbook)
+        rows, self.buffer = self.buffer, []
+        self.snapshot.write(rows)
+
+    def commit(self):
+        """Writes the last batch and publishes the snapshot, a board that changed to no lines still replaces the old one"""
+        self.flush()
+        self.snapshot.commit()
+        self.snapshot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Returns the connection to the pool whether or not the snapshot was published
+        with self.stack:
+            if self.snapshot is not None:
+                self.snapshot.discard()
+                self.snapshot = None
+
+def parlayplay_rows(chunks):
+    """Yields the rows of a ParlayPlay board as its players are decoded"""
+    # Walk the players one at a time instead of building the whole object tree
+    for member, player in JsonStream(chunks).members(streamed={'players'}):
+        if member != 'players':
+            continue
         player_name = player['player']['fullName']
-        normalized_name = unicodedata.normalize('NFKD', player_name).encode('ascii', 'ignore').decode('ascii')
+        normalized_name = normalize_name(player_name)
         for stat in player['stats']:
             altLines = stat.get('altLines', None)
             if altLines:
@@ -188,25 +209,73 @@ def scrape_parlayplay():
                     if not under_multiplier or not over_multiplier:
                         continue
 
-                    output_data.append({
+                    yield {
                         'player': normalized_name,
-                        'prop': propMap.get(prop_name, prop_name),
+                        'prop': prop_registry.resolve('parlayplay', prop_name),
                         'stat_value': stat_value,
                         'over_multi': over_multiplier,
                         'under_multi': under_multiplier
-                    })
-    # Save the JSON response to an output file
-    output_dir = os.getenv("OUTPUT_DIR")
-    output_file = os.path.join(output_dir, 'parlayplay_output.json')
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
-
-    # Export data to MySQL
-    with connect_to_sql() as (cursor, conn):
-        create_table(cursor, 'parlayplay_data')
-        for data in output_data:
-            insert_data(cursor, data, 'parlayplay_data')
-        conn.commit()
+                    }
+
+def scrape_parlayplay(export=True):
+    headers = {
+        'sec-ch-ua': '"Not)A;Brand";v="99", "Google Chrome";v="127", "Chromium";v="127"',
+        'X-ParlayPlay-Platform': 'web',
+        'X-Parlay-Request': '1',
+        'sec-ch-ua-mobile': '?0',
+        'User-Agent': '<user agent>',
+        'Accept': 'application/json, text/plain, */*',
+        'Referer': 'https://parlayplay.io/challenges/crossgame/search',
+        'X-Requested-With': 'XMLHttpRequest',
+        'X-CSRFToken': '<csrf token>',
+        'sec-ch-ua-platform': '"macOS"',
+    }
+
+    params = {
+        'sport': 'All',
+        'league': '',
+        'includeAlt': 'true',
+    }
+    url = 'https://parlayplay.io/api/v1/crossgame/search/'
+    key = cache_key(url, params)
+    fetch = http_cache.fetch('parlayplay')
+    # Stream the board so rows are parsed while it's still downloading
+    response = requests.get(url, params=params, headers={**headers, **fetch.conditional_headers(key)}, stream=True,
+                            timeout=float(os.getenv("PARLAYPLAY_TIMEOUT", 30)))
+
+    # Rows go into a new MySQL snapshot in batches while the rest of the board is still downloading
+    snapshot = StreamingSnapshot('parlayplay', int(os.getenv("PARLAYPLAY_BATCH", 500)))
+
+    def parse(chunks):
+        output_data = []
+        for data in parlayplay_rows(chunks):
+            output_data.append(data)
+            if export:
+                snapshot.add(data)
+        return output_data
+
+    with snapshot:
+        try:
+            output_data = fetch.resolve_stream(key, response.status_code, response.headers, response.iter_content(), parse)
+        finally:
+            response.close()
+
+        # Skip the exports when the rows are handed straight to the analysis or nothing changed,
+        # an unchanged board's batches are discarded with its snapshot
+        if fetch.finish() and export:
+            # Save the JSON response to an output file
+            output_dir = os.getenv("OUTPUT_DIR")
+            output_file = os.path.join(output_dir, 'parlayplay_output.json')
+            with open(output_file, 'w') as f:
+                json.dump(output_data, f, indent=2)
+
+            # Publish the rows written to MySQL during the download
+            snapshot.commit()
+
+    if export:
+        prop_registry.report_unmapped('parlayplay')
+
+    return output_data
 
 if __name__ == '__main__':
     #scrape_parlayplay()
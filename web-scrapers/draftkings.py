@@ -1,276 +1,206 @@
 import requests
 import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import mysql.connector
-from contextlib import contextmanager
 from collections import defaultdict
 import os
-from dotenv import load_dotenv
 import sys
+import time
+import threading
+from requests.adapters import HTTPAdapter
 
-@contextmanager
-def connect_to_sql():
-    """Connects to the SQL using contextmanager to efficiently manage the connection and cursor"""
-    conn = None
-    try:
-        # Load the .env file
-        load_dotenv()
-
-        # Connect to the MySQL database
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
-        )
-        cursor = conn.cursor()
-        yield cursor, conn  # Yield both cursor and connection to use inside the `with` block
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-    finally: # close cursor and conn after usage
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close() 
-
-def create_table(cursor, table_name):
-    """Creates a new table in the MySQL database """
-    # Drop the table if it already exists
-    drop_table_query = f'DROP TABLE IF EXISTS {table_name}'
-    # Create the table
-    create_table_query = f'''
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        player VARCHAR(255),
-        prop VARCHAR(255),
-        stat_value FLOAT,
-        over_multi FLOAT,
-        under_multi FLOAT
-    )
-    '''
-    cursor.execute(drop_table_query)
-    cursor.execute(create_table_query)
-
-def insert_data(cursor, data, table_name):
-    """Inserts data into the MySQL database"""
-    cursor.execute(
-        f'INSERT INTO {table_name} (player, prop, stat_value, over_multi, under_multi) VALUES (%s, %s, %s, %s, %s)',
-        (data['player'], data['prop'], data['stat_value'], data['over_multi'], data['under_multi'])
-    )
+# Allow importing the shared modules from the repository root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from schema import publish_odds
+from database import connect_to_sql
+from httpcache import http_cache, fetch_name
+from props import prop_registry
 
 def fraction_to_multiplier(fractional_odds):
     numerator, denominator = map(int, fractional_odds.split('/'))
     multiplier = (numerator / denominator) * 0.924 + 1 # Dilute the odds
     return round(multiplier, 2)
 
-# MLB
-def draftkings_mlb_scraper():
-    def start_requests(main, sub):
-        session = requests.Session()
-        headers = {
-            'accept': '*/*',
-            'origin': 'https://sportsbook.draftkings.com',
-            'referer': 'https://sportsbook.draftkings.com/',
-            'user-agent': '<user-agent>',
-        }
-        url = f'https://sportsbook-nash.draftkings.com/api/sportscontent/dkusor/v1/leagues/84240/categories/{main}/subcategories/{sub}'
-        response = session.get(
-            url,
-            headers=headers,
-        )
-        return response.json()
-
-    def get_ids():
-        headers = {
-            'accept': '*/*',
-            'accept-language': 'en-US,en;q=0.9',
-            'origin': 'https://sportsbook.draftkings.com',
-            'referer': 'https://sportsbook.draftkings.com/',
-            'user-agent': '<user-agent>'
-        }
-        url = 'https://sportsbook-nash.draftkings.com/api/sportscontent/dkusor/v1/leagues/84240/categories/1031/subcategories/6605'
-        response = requests.get(
-            url,
-            headers=headers
-        )
-        data = response.json()
-        subcategories = data['subcategories']
-        notNeeded = {684, 517, 1297, 493, 754, 972, 758, 1581, 988}
-        ids = [] # (main, sub)
-        for sub in subcategories:
-            if sub['categoryId'] not in notNeeded:
-                ids.append((sub['categoryId'], sub['id']))
-        return ids
-
-    def parse(response):        
-        # Store the output data
-        output_data = []
-        # Get the prop name
-        propMap = {'Walks (Batter)': 'Batter Walks', 'Strikeouts (Batter)': 'Batter Strikeouts', 'Outs': 'Pitching Outs', 
-                    'Alternate Team Total Runs': 'Team Total Runs', 'Strikeouts Thrown': 'Strikeouts',
-                    "Run Line - 1st Inning": "1st Inn. Runs Allowed", "Run Line - 2nd Inning": "2nd Inn. Runs Allowed"}
-        market = response['markets'][0]
-        market_type_name = market['marketType']['name']
-        prop_name = market_type_name.replace("O/U", "").strip()
-        prop_name = propMap.get(prop_name, prop_name)
-        multipliers = defaultdict(list)
-
-        for selection in response['selections']:
-            # Get the player name and stat value
-            player_name = selection['participants'][0]['name']
-            stat_value = selection['points']
-
-            # Get the multipliers for the over and under
-            if selection['label'] == "Over":
-                over_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
-                multipliers[player_name].append(over_multi)
-            elif selection['label'] == "Under":
-                under_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
-                multipliers[player_name].append(under_multi)
-            
-            # Append the base data to the output_data when both multipliers have been found
-            if len(multipliers[player_name]) == 2:
-                output_data.append({
-                    'player': player_name,
-                    'prop': prop_name,
-                    'stat_value': stat_value,
-                    'over_multi': multipliers[player_name][0],
-                    'under_multi': multipliers[player_name][1]
-                })
-        return output_data
-
-    # List of sub categories for different props
-    sub_ids = get_ids()
+def event_start_times(response):
+    """Maps each market id to the start time of its event"""
+    starts = {event['id']: event.get('startEventDate') for event in response.get('events', [])}
+    return {market['id']: starts.get(market.get('eventId')) for market in response.get('markets', [])}
+
+# Leagues scraped by the DraftKings engine. Subcategories whose category (or subcategory) id is
+# excluded aren't player props. Prop names are resolved through the shared prop registry
+LEAGUES = {
+    'mlb': {
+        'league_id': 84240,
+        'excluded_categories': {684, 517, 1297, 493, 754, 972, 758, 1581, 988},
+        'excluded_subcategories': set(),
+    },
+    'nba': {
+        'league_id': 42648,
+        'excluded_categories': {6230, 14648, 13513, 6231, 14182, 4609},
+        'excluded_subcategories': {6230, 14648, 13513, 6231, 14182, 4609},
+    },
+}
+
+HEADERS = {
+    'accept': '*/*',
+    'accept-language': 'en-US,en;q=0.9',
+    'origin': 'https://sportsbook.draftkings.com',
+    'referer': 'https://sportsbook.draftkings.com/',
+    'user-agent': '<user-agent>',
+}
+BASE_URL = 'https://sportsbook-nash.draftkings.com/api/sportscontent/dkusor/v1/leagues'
+
+def configured_leagues():
+    """Returns the leagues to scrape, configurable with DRAFTKINGS_LEAGUES"""
+    leagues = os.getenv("DRAFTKINGS_LEAGUES")
+    return [league.strip() for league in leagues.split(',')] if leagues else list(LEAGUES)
+
+_ids_lock = threading.Lock()
+
+def http_session(workers):
+    """Returns a keep-alive session for one scraper run, with a connection pool sized to its executor"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    return session
+
+def request_timeout():
+    """Returns the per-request timeout in seconds, configurable with DRAFTKINGS_TIMEOUT"""
+    return float(os.getenv("DRAFTKINGS_TIMEOUT", 15))
+
+def ids_cache_path():
+    return os.getenv("DRAFTKINGS_ID_CACHE") or os.path.join(os.getenv("OUTPUT_DIR", '.'), 'draftkings_ids.json')
+
+def read_ids_cache():
+    try:
+        with open(ids_cache_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def start_requests(session, fetch, league, main, sub):
+    url = f'{BASE_URL}/{LEAGUES[league]["league_id"]}/categories/{main}/subcategories/{sub}'
+    response = session.get(url, headers={**HEADERS, **fetch.conditional_headers(url)}, timeout=request_timeout())
+    # An unchanged subcategory re-uses the rows parsed last cycle
+    return fetch.resolve(url, response.status_code, response.headers, response.content,
+                         lambda body: parse(json.loads(body)))
+
+def fetch_ids(session, league_id):
+    """Downloads a league's (category, subcategory) index"""
+    url = f'{BASE_URL}/{league_id}/categories/1031/subcategories/6605'
+    response = session.get(url, headers=HEADERS, timeout=request_timeout())
+    response.raise_for_status() # an error body must not end up in the on-disk cache
+    data = response.json()
+    return [(sub['categoryId'], sub['id']) for sub in data['subcategories']]
+
+def get_ids(session, league):
+    """Returns a league's prop subcategories, from the on-disk cache while it's younger than DRAFTKINGS_ID_TTL"""
+    config = LEAGUES[league]
+    ttl = float(os.getenv("DRAFTKINGS_ID_TTL", 21600))
+    key = str(config['league_id'])
+
+    cached = read_ids_cache().get(key)
+    if cached and time.time() - cached['fetched_at'] < ttl:
+        subcategories = cached['ids']
+    else:
+        subcategories = fetch_ids(session, config['league_id'])
+        # Leagues are discovered concurrently so the cache file is updated under a lock
+        with _ids_lock:
+            cache = read_ids_cache()
+            cache[key] = {'fetched_at': time.time(), 'ids': subcategories}
+            path = ids_cache_path()
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(cache, f)
+            os.replace(f'{path}.tmp', path)
+
+    # The unfiltered index is cached so edits to the exclusions apply straight away
+    ids = [] # (main, sub)
+    for main, sub in subcategories:
+        if main not in config['excluded_categories'] and sub not in config['excluded_subcategories']:
+            ids.append((main, sub))
+    return ids
+
+def parse(response):
+    # Store the output data
+    output_data = []
+    # Get the prop name
+    market = response['markets'][0]
+    market_type_name = market['marketType']['name']
+    prop_name = market_type_name.replace("O/U", "").strip()
+    prop_name = prop_registry.resolve('draftkings', prop_name)
+    multipliers = defaultdict(list)
+    start_times = event_start_times(response)
+
+    for selection in response['selections']:
+        # Get the player name and stat value
+        player_name = selection['participants'][0]['name']
+        stat_value = selection['points']
+
+        # Get the multipliers for the over and under
+        if selection['label'] == "Over":
+            over_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
+            multipliers[player_name].append(over_multi)
+        elif selection['label'] == "Under":
+            under_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
+            multipliers[player_name].append(under_multi)
+
+        # Append the base data to the output_data when both multipliers have been found
+        if len(multipliers[player_name]) == 2:
+            output_data.append({
+                'player': player_name,
+                'prop': prop_name,
+                'stat_value': stat_value,
+                'over_multi': multipliers[player_name][0],
+                'under_multi': multipliers[player_name][1],
+                'start_time': start_times.get(selection.get('marketId'))
+            })
+    return output_data
+
+def draftkings_scraper(leagues=None, export=True):
+    """Scrapes every configured league through one shared pool and publishes them as one snapshot"""
+    # A fetch of only some leagues (the scheduler polls each league on its own) is cached apart
+    fetch = http_cache.fetch(fetch_name('draftkings', leagues))
+    leagues = leagues or configured_leagues()
+    workers = int(os.getenv("DRAFTKINGS_WORKERS", 10))
     output_data = []
-    # Use ThreadPoolExecutor to send requests concurrently
-    with ThreadPoolExecutor(max_workers=10) as executor: 
-        futures = [executor.submit(start_requests, main, sub) for main, sub in sub_ids]
 
-        for future in as_completed(futures):
+    # Subcategory requests are queued as soon as their league's ids arrive, so the leagues share
+    # one pool and the run takes about as long as the slowest league. The session is this run's
+    # own, so a concurrent run of other leagues never has its connections closed underneath it
+    with http_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        id_futures = {executor.submit(get_ids, session, league): league for league in leagues}
+        futures = {}
+        for future in as_completed(id_futures):
+            league = id_futures[future]
             try:
-                response = future.result()
-                output_data.extend(parse(response))
+                sub_ids = future.result()
             except Exception as e:
+                print(f"Error getting DraftKings {league} subcategories: {e}")
                 continue
-
-    # Export data to json
-    output_dir = os.getenv("OUTPUT_DIR")
-    with open(os.path.join(output_dir, 'draftkings_output.json'), 'w') as f:
-        json.dump(output_data, f, indent=2)
-
-    # Export data to MySQL
-    with connect_to_sql() as (cursor, conn):
-        create_table(cursor, 'draftkings_data')
-        for data in output_data:
-            insert_data(cursor, data, 'draftkings_data')
-        conn.commit()
-
-# NBA
-def draftkings_nba_scraper():
-    def start_requests(main, sub):
-        session = requests.Session()
-        headers = {
-            'accept': '*/*',
-            'origin': 'https://sportsbook.draftkings.com',
-            'referer': 'https://sportsbook.draftkings.com/',
-            'user-agent': '<user-agent>',
-        }
-        url = f'https://sportsbook-nash.draftkings.com/api/sportscontent/dkusor/v1/leagues/42648/categories/{main}/subcategories/{sub}'
-        response = session.get(
-            url,
-            headers=headers,
-        )
-        return response.json()
-
-    def get_ids():
-        headers = {
-            'accept': '*/*',
-            'accept-language': 'en-US,en;q=0.9',
-            'origin': 'https://sportsbook.draftkings.com',
-            'referer': 'https://sportsbook.draftkings.com/',
-            'user-agent': '<user-agent>'
-        }
-        url = 'https://sportsbook-nash.draftkings.com/api/sportscontent/dkusor/v1/leagues/42648/categories/1031/subcategories/6605'
-        response = requests.get(
-            url,
-            headers=headers
-        )
-        data = response.json()
-        subcategories = data['subcategories']
-        notNeeded = {6230, 14648, 13513, 13513, 6231, 14182, 4609}
-
-        ids = [] # (main, sub)
-        for sub in subcategories:
-            if sub['categoryId'] not in notNeeded and sub['id'] not in notNeeded:
-                ids.append((sub['categoryId'], sub['id']))
-
-        return ids
-
-    def parse(response):        
-        # Store the output data
-        output_data = []
-        # Get the prop name
-        propMap = {'Three Pointers Made': '3-Pointers Made', 'Points + Rebounds + Assists': 'Pts + Rebs + Asts'}
-        market = response['markets'][0]
-        market_type_name = market['marketType']['name']
-        prop_name = market_type_name.replace("O/U", "").strip()
-        prop_name = propMap.get(prop_name, prop_name)
-        prop_name_set.add(prop_name)
-        multipliers = defaultdict(list)
-
-        for selection in response['selections']:
-            # Get the player name and stat value
-            player_name = selection['participants'][0]['name']
-            stat_value = selection['points']
-
-            # Get the multipliers for the over and under
-            if selection['label'] == "Over":
-                over_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
-                multipliers[player_name].append(over_multi)
-            elif selection['label'] == "Under":
-                under_multi = fraction_to_multiplier(selection['displayOdds']['fractional'])
-                multipliers[player_name].append(under_multi)
-            
-            # Append the base data to the output_data when both multipliers have been found
-            if len(multipliers[player_name]) == 2:
-                output_data.append({
-                    'player': player_name,
-                    'prop': prop_name,
-                    'stat_value': stat_value,
-                    'over_multi': multipliers[player_name][0],
-                    'under_multi': multipliers[player_name][1]
-                })
-        return output_data
-
-    # List of sub categories for different props
-    sub_ids = get_ids()
-    output_data = []
-    prop_name_set = set()
-    # Use ThreadPoolExecutor to send requests concurrently
-    with ThreadPoolExecutor(max_workers=10) as executor: 
-        futures = {executor.submit(start_requests, main, sub): sub for main, sub in sub_ids}
+            for main, sub in sub_ids:
+                futures[executor.submit(start_requests, session, fetch, league, main, sub)] = league
 
         for future in as_completed(futures):
             try:
-                response = future.result()
-                parsed_data = parse(response)
-                output_data.extend(parsed_data)
+                output_data.extend(future.result())
             except Exception as e:
-                # print(f"Error processing sub {sub}: {e}")
                 continue
-    # Export data to json
-    output_dir = os.getenv("OUTPUT_DIR")
-    with open(os.path.join(output_dir, 'draftkings_output.json'), 'w') as f:
-        json.dump(output_data, f, indent=2)
 
-    # Export data to MySQL
-    with connect_to_sql() as (cursor, conn):
-        create_table(cursor, 'draftkings_data')
-        for data in output_data:
-            insert_data(cursor, data, 'draftkings_data')
-        conn.commit()
+    # Skip the exports when the rows are handed straight to the analysis or nothing changed
+    if fetch.finish() and export:
+        # Export data to json
+        output_dir = os.getenv("OUTPUT_DIR")
+        with open(os.path.join(output_dir, 'draftkings_output.json'), 'w') as f:
+            json.dump(output_data, f, indent=2)
+
+        # Export data to MySQL
+        with connect_to_sql() as (cursor, conn):
+            publish_odds(cursor, conn, 'draftkings', output_data)
+
+    # The pipeline and scheduler collect the unmapped markets themselves, a standalone run reports its own
+    if export:
+        prop_registry.report_unmapped('draftkings')
+
+    return output_data
 
 
 if __name__ == '__main__':
-    draftkings_mlb_scraper()
-    draftkings_nba_scraper()
\ No newline at end of file
+    draftkings_scraper()
@@ -6,7 +6,27 @@
 import scrapy
 
 
+def to_float(value):
+    return float(value) if value is not None else None
+
+
 class ScrapersItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+    # One over/under line offered by a sportsbook
+    player = scrapy.Field()
+    prop = scrapy.Field()
+    stat_value = scrapy.Field(serializer=float)
+    over_multi = scrapy.Field(serializer=to_float)
+    under_multi = scrapy.Field(serializer=to_float)
+    start_time = scrapy.Field()
+
+    @classmethod
+    def from_row(cls, data):
+        """Builds an item from a parsed output row, converting the numbers"""
+        return cls(
+            player=data['player'],
+            prop=data['prop'],
+            stat_value=float(data['stat_value']),
+            over_multi=to_float(data['over_multi']),
+            under_multi=to_float(data['under_multi']),
+            start_time=data.get('start_time'),
+        )
@@ -3,11 +3,118 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import os
+import sys
+import json
+import time
+from contextlib import ExitStack
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from twisted.internet import defer, threads
+from scrapy.utils.defer import maybe_deferred_to_future
+
+# Allow importing the shared modules from the repository root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from schema import open_snapshot
+from database import connect_to_sql
+
+
+class SpiderExport:
+    """A spider's pending rows, its open snapshot and its write stats"""
+
+    def __init__(self):
+        self.buffer = []
+        self.rows = []
+        self.writes = defer.succeed(None)  # flushes run one after another on the same connection
+        self.stack = ExitStack()
+        self.snapshot = None
+        self.started_at = time.monotonic()
+        self.flushes = 0
+        self.flush_seconds = []
 
 
 class ScrapersPipeline:
-    def process_item(self, item, spider):
+    """Buffers a spider's items and writes them to MySQL in batches on the reactor's thread pool"""
+
+    def __init__(self, crawler, batch_size):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.batch_size = batch_size
+        self.export = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler, crawler.settings.getint("DB_FLUSH_BATCH", 500))
+
+    def open_spider(self):
+        self.export = SpiderExport()
+
+    def process_item(self, item):
+        self.export.buffer.append(ItemAdapter(item).asdict())
+        if len(self.export.buffer) >= self.batch_size:
+            self.flush(self.crawler.spider, self.export)
         return item
+
+    def flush(self, spider, export):
+        rows, export.buffer = export.buffer, []
+        export.rows.extend(rows)
+        export.writes.addCallback(lambda _: threads.deferToThread(self.write, spider, export, rows))
+
+    def write(self, spider, export, rows):
+        """Loads a batch into the spider's snapshot (runs on a pool thread)"""
+        started = time.monotonic()
+        if export.snapshot is None:
+            cursor, conn = export.stack.enter_context(connect_to_sql())
+            export.snapshot = open_snapshot(cursor, conn, spider.name)
+        export.snapshot.write(rows)
+        export.flushes += 1
+        export.flush_seconds.append(time.monotonic() - started)
+
+    def commit(self, spider, export):
+        """Publishes the snapshot and writes the json output (runs on a pool thread)"""
+        if export.snapshot is None:
+            # A board that changed to no lines still replaces the old one
+            cursor, conn = export.stack.enter_context(connect_to_sql())
+            export.snapshot = open_snapshot(cursor, conn, spider.name)
+        export.snapshot.commit()
+        export.snapshot = None
+
+        output_dir = os.getenv("OUTPUT_DIR")
+        with open(os.path.join(output_dir, f'{spider.name}_output.json'), 'w') as f:
+            json.dump(export.rows, f, indent=2)
+
+    def release(self, export):
+        """Discards a snapshot that was never published and returns the connection to the pool (runs on a pool thread)"""
+        with export.stack:
+            if export.snapshot is not None:
+                export.snapshot.discard()
+                export.snapshot = None
+
+    def record_stats(self, spider, export):
+        elapsed = time.monotonic() - export.started_at
+        items = len(export.rows)
+        self.stats.set_value(f'db/{spider.name}/items', items)
+        self.stats.set_value(f'db/{spider.name}/items_per_second', items / elapsed if elapsed else 0)
+        self.stats.set_value(f'db/{spider.name}/flushes', export.flushes)
+        if export.flush_seconds:
+            self.stats.set_value(f'db/{spider.name}/flush_seconds_avg', sum(export.flush_seconds) / len(export.flush_seconds))
+            self.stats.set_value(f'db/{spider.name}/flush_seconds_max', max(export.flush_seconds))
+        spider.logger.info(f"Exported {items} items in {export.flushes} flushes ({items / elapsed if elapsed else 0:.0f} items/s)")
+
+    async def close_spider(self):
+        spider = self.crawler.spider
+        export, self.export = self.export, None
+
+        # Spiders only mark a board for publishing when it changed and export is on
+        if getattr(spider, 'publish', False):
+            if export.buffer:
+                self.flush(spider, export)
+            export.writes.addCallback(lambda _: threads.deferToThread(self.commit, spider, export))
+            export.writes.addCallback(lambda _: self.record_stats(spider, export))
+        export.writes.addErrback(lambda failure: spider.logger.error(f"Error exporting {spider.name} data: {failure.value}"))
+
+        # Whether the writes succeeded or not, the connection goes back to the pool
+        export.writes.addBoth(lambda _: threads.deferToThread(self.release, export))
+        export.writes.addErrback(lambda failure: spider.logger.error(f"Error releasing the {spider.name} snapshot: {failure.value}"))
+        await maybe_deferred_to_future(export.writes)
@@ -1,129 +1,226 @@
 import scrapy
+from twisted.internet import threads
+from scrapy.utils.defer import maybe_deferred_to_future
 import json
-import requests
-import unicodedata
 import math
+from abc import ABC, abstractmethod
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
-import mysql.connector
-from contextlib import contextmanager
 import os
-from dotenv import load_dotenv
-
-@contextmanager
-def connect_to_sql():
-    """Connects to the SQL using contextmanager to efficiently manage the connection and cursor"""
-    conn = None
-    try:
-        # Load the .env file
-        load_dotenv()
-
-        # Connect to the MySQL database
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME")
+import sys
+
+# Allow importing the shared modules from the repository root and the scrapy project
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'scrapers.settings') # enables ScrapersPipeline
+from httpcache import http_cache, cache_key
+from player_directory import player_directory
+from player_index import normalize_name
+from jsonstream import JsonStream, byte_chunks
+from props import prop_registry
+from scrapers.items import ScrapersItem
+
+class CachedSpider(scrapy.Spider, ABC):
+    """Sends conditional requests and only parses and yields items for a board that changed since the last crawl"""
+    export = True # set to False to keep the rows in memory for the pipeline
+
+    def cached_request(self, url, headers=None, body=None, method='GET'):
+        key = cache_key(url, body=body)
+        return scrapy.Request(
+            url = url,
+            method = method,
+            headers = {**(headers or {}), **http_cache.conditional_headers(key)},
+            body = body,
+            callback=self.parse,
+            cb_kwargs={'key': key},
+            meta={'handle_httpstatus_list': [304]}, # a 304 means the board hasn't changed
         )
-        cursor = conn.cursor()
-        yield cursor, conn  # Yield both cursor and connection to use inside the `with` block
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
-    finally: # close cursor and conn after usage
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close() 
-
-def create_table(cursor, table_name):
-    """Creates a new table in the MySQL database """
-    # Drop the table if it already exists
-    drop_table_query = f'DROP TABLE IF EXISTS {table_name}'
-    # Create the table
-    create_table_query = f'''
-    CREATE TABLE IF NOT EXISTS {table_name} (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        player VARCHAR(255),
-        prop VARCHAR(255),
-        stat_value FLOAT,
-        over_multi FLOAT,
-        under_multi FLOAT
-    )
-    '''
-    cursor.execute(drop_table_query)
-    cursor.execute(create_table_query)
-
-def insert_data(cursor, data, table_name):
-    """Inserts data into the MySQL database"""
-    cursor.execute(
-        f'INSERT INTO {table_name} (player, prop, stat_value, over_multi, under_multi) VALUES (%s, %s, %s, %s, %s)',
-        (data['player'], data['prop'], data['stat_value'], data['over_multi'], data['under_multi'])
-    )
-
-class UnderdogScraper(scrapy.Spider):
+
+    def start_requests(self):
+        for url in self.start_urls:
+            yield self.cached_request(url)
+
+    async def start(self):
+        # Scrapy 2.13+ only calls start(), older versions call start_requests() directly
+        for request in self.start_requests():
+            yield request
+
+    def parse(self, response, key):
+        fetch = http_cache.fetch(self.name)
+        validators = {name: response.headers.get(name, b'').decode() or None for name in ('ETag', 'Last-Modified')}
+        output_data = fetch.resolve(key, response.status, validators, response.body, self.parse_rows)
+
+        # Every row is converted before anything is published, so a bad row can't leave a partial
+        # snapshot over the live table or a board the cache thinks was already seen
+        items = []
+        if self.export:
+            try:
+                items = [ScrapersItem.from_row(data) for data in output_data]
+            except Exception:
+                fetch.discard()
+                raise
+
+        # Keep the rows on the spider so the pipeline can collect them
+        self.output_data = output_data
+
+        # Skip the exports when the rows are handed straight to the analysis or nothing changed,
+        # otherwise ScrapersPipeline writes the items off the reactor thread
+        self.publish = fetch.finish() and self.export
+        if self.publish:
+            yield from items
+
+    def closed(self, reason):
+        # The pipeline and scheduler collect the unmapped markets themselves, a standalone crawl reports its own
+        if self.export:
+            unmapped = prop_registry.collect_unmapped(self.name)
+            if unmapped:
+                self.logger.warning(f"{len(unmapped)} unmapped markets: {', '.join(sorted(unmapped))}")
+
+    @abstractmethod
+    def parse_rows(self, body):
+        """Converts a response body into output rows"""
+
+class PropSegmenter:
+    """Splits '<player> <prop>' titles by matching the longest known prop phrase from the right with a token trie"""
+
+    def __init__(self, phrases=()):
+        self.trie = {}
+        self.update(phrases)
+
+    def update(self, phrases):
+        for phrase in phrases:
+            node = self.trie
+            for token in reversed(phrase.upper().split()):
+                node = node.setdefault(token, {})
+            node[None] = True # a phrase ends here
+
+    def split(self, title):
+        """Returns (player, prop), or (None, None) if no known phrase ends the title"""
+        words = title.split()
+        node, longest = self.trie, 0
+        for depth, word in enumerate(reversed(words), 1):
+            node = node.get(word.upper())
+            if node is None:
+                break
+            if None in node:
+                longest = depth
+        # A phrase has to leave something for the player name
+        if not longest or longest == len(words):
+            return None, None
+        return ' '.join(words[:-longest]), ' '.join(words[-longest:])
+
+class UnderdogScraper(CachedSpider):
     name = 'underdog'
     allowed_domains = ['api.underdogfantasy.com']
     start_urls = ['https://api.underdogfantasy.com/beta/v6/over_under_lines']
 
-    def parse(self, response):
-        data = json.loads(response.body)
-        lines = data.get("over_under_lines", [])
-        prop_names = {
-            "FANTASY", "POINTS", "REBOUNDS", "ASSISTS", "STEALS", "BLOCKS", "TURNOVERS",
-            "1ST", "INN.", "STRIKEOUTS", "OUTS", "RUNS", "HITS", "WALKS", "BASES",
-            "RBI", "HOME", "TOTAL", "SINGLES", "DOUBLES", "TRIPLES", "HOMERUNS", 
-            "RBIS", "HR", "GAMES", "AC", "GAME", "SET", "MATCH", "ACES", "DOUBLES", 
-            "FAULTS", "SETS", "GAMES", "LOST", "WON", "SERVES", "RETURN", "PITCHES", 
-            "RUNS ALLOWED", "PITCHING", "OUTS", "GOALS", "RUSHING", "1-3", "EARNED",
-            "BATTER", "1H", "DOUBLE", "KICKING", "3PM", "TACKLES", "PASSING", "RUSH",
-            "RECEIVING", "COMPLETIONS", "INTERCEPTIONS", "FG", "XP", "LONGEST", "KICKING",
-            "KILLS", "DEATHS", "HEADSHOTS", "RECEPTIONS", "SACKS", "PASSES", "CROSSES",
-            "PTS", "3-POINTERS", "STROKES", "BIRDIES", "TOP", "BOGEYS", "SAVES", "SHOTS",
-            "FINISHING", "CLEARANCES", "FOULS", "PASS"
+    prop_names = {
+        "FANTASY", "POINTS", "REBOUNDS", "ASSISTS", "STEALS", "BLOCKS", "TURNOVERS",
+        "1ST", "INN.", "STRIKEOUTS", "OUTS", "RUNS", "HITS", "WALKS", "BASES",
+        "RBI", "HOME", "TOTAL", "SINGLES", "DOUBLES", "TRIPLES", "HOMERUNS", 
+        "RBIS", "HR", "GAMES", "AC", "GAME", "SET", "MATCH", "ACES", "DOUBLES", 
+        "FAULTS", "SETS", "GAMES", "LOST", "WON", "SERVES", "RETURN", "PITCHES", 
+        "RUNS ALLOWED", "PITCHING", "OUTS", "GOALS", "RUSHING", "1-3", "EARNED",
+        "BATTER", "1H", "DOUBLE", "KICKING", "3PM", "TACKLES", "PASSING", "RUSH",
+        "RECEIVING", "COMPLETIONS", "INTERCEPTIONS", "FG", "XP", "LONGEST", "KICKING",
+        "KILLS", "DEATHS", "HEADSHOTS", "RECEPTIONS", "SACKS", "PASSES", "CROSSES",
+        "PTS", "3-POINTERS", "STROKES", "BIRDIES", "TOP", "BOGEYS", "SAVES", "SHOTS",
+        "FINISHING", "CLEARANCES", "FOULS", "PASS"
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Seeded with the registry's prop names, then learns each board's display stats during this crawl
+        self.prop_segmenter = PropSegmenter(prop_registry.phrases(self.name))
+        self.keyword_splits = []
+
+    def parse_line(self, line):
+        """Converts one over/under line into a row that still needs its names resolved (None if it doesn't have both multipliers)"""
+        payout_multipliers = []
+        for option in line.get('options'):
+            multiplier = float(option['payout_multiplier']) * math.sqrt(3.15) # noramlize to 1.77 
+            payout_multipliers.append(round(multiplier, 2))
+        if len(payout_multipliers) < 2:
+            return None
+
+        appearance_stat = line['over_under'].get('appearance_stat', {})
+        return {
+            'title': line['over_under']['title'],
+            'display_stat': appearance_stat.get('display_stat'),
+            'stat_value': float(line.get('stat_value')),
+            'over_multi': payout_multipliers[0],
+            'under_multi': payout_multipliers[1],
+            'appearance_id': appearance_stat.get('appearance_id'),
         }
+
+    def keyword_split(self, title):
+        """The old guess: the prop starts at the first word that looks like a stat"""
+        words = title.split()
+        for i, word in enumerate(words):
+            if word.upper() in self.prop_names:
+                return ' '.join(words[:i]), ' '.join(words[i:])
+        return None, None
+
+    def split_title(self, title, player_name, display_stat):
+        """Splits a line title into (player, prop), trusting the structured fields over the title text"""
+        title = title.replace("O/U", "").strip()
+        if display_stat and title.endswith(display_stat):
+            return player_name or title[:-len(display_stat)].strip(), display_stat
+        if player_name and title.startswith(player_name):
+            return player_name, title[len(player_name):].strip()
+
+        # Match the longest known prop phrase from the end of the title
+        player, prop = self.prop_segmenter.split(title)
+        if prop is None:
+            player, prop = self.keyword_split(title)
+            self.keyword_splits.append(title)
+        prop = prop or "UNKNOWN"
+        return player_name or player or prop, prop
+
+    def parse_rows(self, body):
+        # Walk the board one record at a time instead of building the whole object tree
+        lines = []
+        games, appearances, players = {}, {}, {}
+        records = JsonStream(byte_chunks(body)).members(streamed={'over_under_lines', 'games', 'solo_games', 'appearances', 'players'})
+        for key, record in records:
+            if key == 'over_under_lines':
+                data = self.parse_line(record)
+                if data:
+                    lines.append(data)
+            elif key == 'games':
+                games[record['id']] = record.get('scheduled_at')
+            elif key == 'solo_games':
+                games[record['id']] = record.get('starts_at')
+            elif key == 'appearances':
+                appearances[record['id']] = (record.get('match_id'), record.get('player_id'))
+            elif key == 'players':
+                players[record['id']] = f"{record.get('first_name', '')} {record.get('last_name', '')}".strip()
+
+        # Learn this board's prop phrases before splitting the titles that lack structured fields
+        self.prop_segmenter.update(data['display_stat'] for data in lines if data['display_stat'])
+        self.keyword_splits = []
+
+        # Games, appearances and players can come after the lines so the names are resolved last
         output_data = []
-        unique = set()
-        for line in lines:
-            stat_value = float(line.get('stat_value'))
-            words = line['over_under']['title'].split() 
-            payout_multipliers = []
-            for option in line.get('options'):
-                multiplier = float(option['payout_multiplier']) * math.sqrt(3.15) # noramlize to 1.77 
-                payout_multipliers.append(round(multiplier, 2))
-
-            player_name = None
-            prop_name = None
-
-            for i, word in enumerate(words):
-                if word.upper() in prop_names:
-                    player_name = ' '.join(words[:i])
-                    prop_name = ' '.join(words[i:])
-                    break
-            
-            prop_name = prop_name.replace("O/U", "").strip() if prop_name else "UNKNOWN" 
-            unique.add(prop_name)
-            if len(payout_multipliers) > 1:
-                output_data.append({
-                    'player': player_name if player_name else prop_name,
-                    'prop': prop_name,
-                    'stat_value': stat_value,
-                    'over_multi': payout_multipliers[0],
-                    'under_multi': payout_multipliers[1]
-                })
-
-        # Export data to JSON
-        output_dir = os.getenv("OUTPUT_DIR")
-        with open(os.path.join(output_dir, 'underdog_output.json'), 'w') as f:
-            json.dump(output_data, f, indent=2)
-        
-        # Export data to MySQL
-        with connect_to_sql() as (cursor, conn):
-            create_table(cursor, 'underdog_data')
-            for data in output_data:
-                insert_data(cursor, data, 'underdog_data')
-            conn.commit()
-
-class VividPicksScraper(scrapy.Spider):
+        for data in lines:
+            match_id, player_id = appearances.get(data['appearance_id'], (None, None))
+            player_name, prop_name = self.split_title(data['title'], players.get(player_id), data['display_stat'])
+            output_data.append({
+                'player': player_name,
+                'prop': prop_registry.resolve(self.name, prop_name),
+                'stat_value': data['stat_value'],
+                'over_multi': data['over_multi'],
+                'under_multi': data['under_multi'],
+                'start_time': games.get(match_id),
+            })
+
+        # The keyword guess can disagree with the phrase segmenter, so say when it was needed
+        if self.keyword_splits:
+            self.logger.warning(f"{len(self.keyword_splits)} titles matched no known prop and were split by keyword, "
+                                f"e.g. {self.keyword_splits[0]!r}; add their props to the prop registry")
+        return output_data
+
+class VividPicksScraper(CachedSpider):
     name = 'vividpicks'
     allowed_domains = ['api.betcha.one']
     start_urls = ['https://api.betcha.one/v1/game/activePlayersForLeagueBoard']
@@ -142,42 +239,25 @@ class VividPicksScraper(scrapy.Spider):
             "matchUp": False
         }
         for url in self.start_urls:
-            yield scrapy.Request(
-                url = url,
-                method = "POST",
-                headers = headers,
-                body = json.dumps(payload),
-                callback=self.parse
-            )
-
-    def parse(self, response):
-        data = json.loads(response.body)
+            yield self.cached_request(url, headers=headers, body=json.dumps(payload), method="POST")
+
+    def parse_rows(self, body):
+        data = json.loads(body)
         games = data.get("gret", [])
-        propMap = {
-            "TotalBases": "Total Bases", "RunsBattedIn": "Runs Batted In", "PitchingStrikeouts": "Pitching Outs",
-            "ReceivingYards": "Receiving Yards", "RushingYards": "Rushing Yards", "PassingYards": "Passing Yards", 
-            "ReceivingTouchdowns": "Receiving TDs", "Receiving Tds": "Receiving TDs", "Pts + Ast": "Points + Assists",
-            "3PT Made": "3-Pointers Made", "Shots OnTarget": "Shots on Target", "Points + Rebounds + Assists": "Pts + Rebs + Asts",
-            "Pts + Reb": "Points + Rebounds", "Interceptions Thrown": "Interceptions", "Field Goals Made": "FG Made",
-            "Shot Attempts": "Shots Attempted", "Passing Tds": "Passing TDs", "RushingTouchdowns": "Rushing TDs",
-            "Reb + Ast": "Rebounds + Assists", "Rushing Touchdowns": "Rushing TDs", "PassingTouchdowns": "Passing TDs",
-            "Total Tackles": "Tackles", "Kills Gm 1-3": "kills in game 1+3", "Earned Runs": "Earned Runs Allowed",
-            "Pass Attempts": "Passing Attempts", "Rush Attempts": "Rushing Attempts"
-        }
         output_data = []
         for game in games:
             active_players = game.get("activePlayers")
 
             for player in active_players:
                 player_name = player.get("name")
-                normalized_name = unicodedata.normalize('NFKD', player_name).encode('ascii', 'ignore').decode('ascii')
+                normalized_name = normalize_name(player_name)
                 visual_props = player.get("visiblePlayerProps", {})
                 config_props = player.get("configPlayerProps", {})
 
                 for prop in visual_props:
-                    prop_name = propMap.get(prop.get("p"), prop.get("p"))
+                    prop_name = prop_registry.resolve(self.name, prop.get("p"))
                     prop_value = prop.get("val")
-                    config_prop = config_props.get(prop_name, None)
+                    config_prop = config_props.get(prop.get("p"), None) # keyed by VividPicks' own name
                     multiplier = config_prop.get("multiplier") if config_prop else 1
                     # Skip if the multiplier isn't 1
                     if multiplier != 1:
@@ -191,18 +271,9 @@ class VividPicksScraper(scrapy.Spider):
                         'under_multi': 1.77
                     })
 
-        output_dir = os.getenv("OUTPUT_DIR")
-        with open(os.path.join(output_dir, 'vividpicks_output.json'), 'w') as f:
-            json.dump(output_data, f, indent=2)
-
-        # Export data to MySQL
-        with connect_to_sql() as (cursor, conn):
-            create_table(cursor, 'vividpicks_data')
-            for data in output_data:
-                insert_data(cursor, data, 'vividpicks_data')
-            conn.commit()
+        return output_data
 
-class SleeperScraper(scrapy.Spider):
+class SleeperScraper(CachedSpider):
     name = 'sleeper'
     allowed_domains = ['api.sleeper.app']
     start_urls = ['https://api.sleeper.app/lines/available?dynamic=true&include_preseason=true&first_sport=nfl,nba,mlb,wnba,nhl,cfb,cbb']
@@ -217,7 +288,6 @@ class SleeperScraper(scrapy.Spider):
             'authorization':'<auth token>',
             'x-api-client':'api.cached',
             'accept-language':'en-US,en;q=0.9',
-            'if-none-match':'W/"8e1234e2bc0925f3b1271dc12f91f6f4"',
             'user-agent':'<user-agent>',
             'x-device-id':'<device id>',
             'x-platform':'ios',
@@ -225,78 +295,29 @@ class SleeperScraper(scrapy.Spider):
             'x-bundle':'com.blitzstudios.sleeperbot'
         }
         for url in self.start_urls:
-            yield scrapy.Request(
-                url = url,
-                method = "GET",
-                headers = headers,
-                callback=self.parse
-            )
-
-    # Creates a hashmap to map the subject id to the player's name
-    def get_mlb_player_map(self): 
-        response_data = requests.get("https://api.sleeper.app/v1/players/mlb")
-        players_data = response_data.json()
-
-        players_map = {}
-
-        for player_id, player_info in players_data.items():
-            metadata = player_info.get("metadata", {})
-            full_name = metadata.get("full_name", "UNKNOWN")
-            normalized_name = unicodedata.normalize('NFKD', full_name).encode('ascii', 'ignore').decode('ascii') # convert special characters
-            players_map[player_id] = normalized_name
-
-        return players_map
-    def get_nba_player_map(self): 
-        response_data = requests.get("https://api.sleeper.app/v1/players/nba")
-        players_data = response_data.json()
-
-        players_map = {}
-
-        for player_id, player_info in players_data.items():
-            full_name = player_info.get("full_name", "UNKNOWN")
-            normalized_name = unicodedata.normalize('NFKD', full_name).encode('ascii', 'ignore').decode('ascii') # convert special characters
-            players_map[player_id] = normalized_name
-
-        return players_map
-    def get_cbb_player_map(self): 
-        response_data = requests.get("https://api.sleeper.app/v1/players/cbb")
-        players_data = response_data.json()
-
-        players_map = {}
-
-        for player_id, player_info in players_data.items():
-            full_name = player_info.get("full_name", "UNKNOWN")
-            normalized_name = unicodedata.normalize('NFKD', full_name).encode('ascii', 'ignore').decode('ascii')
-            players_map[player_id] = normalized_name
-        return players_map
-
-    def parse(self, response):
-        data = json.loads(response.body)
+            yield self.cached_request(url, headers=headers)
+
+    async def start(self):
+        # Player names come from the on-disk directory, refreshed in the background once it's older than its TTL.
+        # A cold start downloads it, so it's loaded on a pool thread before the crawl instead of on the reactor
+        try:
+            self.player_names = await maybe_deferred_to_future(threads.deferToThread(player_directory('nba').player_map))
+        except Exception as e:
+            self.logger.error(f"Error loading the Sleeper player directory: {e}")
+            self.player_names = {}
+        async for request in super().start():
+            yield request
+
+    def parse_rows(self, body):
+        data = json.loads(body)
         output_data = []
-        # playerMap = self.get_mlb_player_map()
-        # propMap = {
-        #     "fantasy_points": "Fantasy Points", "hits_runs_rbis": "Hits + Runs + RBIs",
-        #     "strike_outs": "Strikeouts", "doubles": "Doubles", "hits_allowed": "Hits Allowed",
-        #     "bat_strike_outs": "Batter Strikeouts", "earned_runs": "Earned Runs Allowed",
-        #     "first_inning_runs": "1st Inn. Runs", "hits": "Hits", "runs": "Runs",
-        #     "walks": "Batter Walks", "rbis": "RBIs", "home_runs": "Home Runs",
-        #     "singles": "Singles", "total_bases": "Total Bases", "outs": "Pitching Outs",
-        #     "stolen_bases": "Stolen Bases", "bat_walks": "Batter Walks",
-        #     "1st Inn. Runs": "1st Inn. Runs Allowed"
-        # }
-        playerMap = self.get_nba_player_map()
-        propMap = {
-            "fantasy_points": "Fantasy Points", "blocks": "Blocks", "steals": "Steals", "assists": "Assists", "points": "Points",
-            "rebounds": "Rebounds", "turnovers": "Turnovers", "threes_made": "3-Pointers Made", "points_rebounds": "Points + Rebounds",
-            "points_and_assists": "Points + Assists", "rebounds_and_assists": "Rebounds + Assists", "pts_reb_ast": "Pts + Rebs + Asts",
-            "blocks_and_steals": "Blocks + Steals", "points_and_rebounds": "Points + Rebounds", "points_and_assists": "Points + Assists",
-        }
+        playerMap = self.player_names
 
         for item in data:
             options = item["options"]
             subjectid = options[0]["subject_id"]
             player_name = playerMap.get(subjectid, subjectid)
-            prop_name = propMap.get(options[0]["wager_type"], options[0]["wager_type"])
+            prop_name = prop_registry.resolve(self.name, options[0]["wager_type"])
             stat_value = options[0]["outcome_value"]
             payout_multipliers = []
 
@@ -310,16 +331,7 @@ class SleeperScraper(scrapy.Spider):
                 'over_multi': payout_multipliers[0],
                 'under_multi': payout_multipliers[1]
             })
-        output_dir = os.getenv("OUTPUT_DIR")
-        with open(os.path.join(output_dir, 'sleeper_output.json'), 'w') as f:
-            json.dump(output_data, f, indent=2)
-
-        # Export data to MySQL
-        with connect_to_sql() as (cursor, conn):
-            create_table(cursor, 'sleeper_data')
-            for data in output_data:
-                insert_data(cursor, data, 'sleeper_data')
-            conn.commit()
+        return output_data
 
 def main():
     settings = get_project_settings()